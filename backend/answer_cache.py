@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity needed for a hit
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))  # seconds
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "5000"))
+
+
+class SemanticAnswerCache:
+    """
+    Caches final answers per user, keyed by the query embedding.
+    A new question is a hit if it is close enough (cosine) to a cached question of the same user.
+    Entries expire after a TTL and the least recently used ones are evicted when the cache is full.
+    Thread-safe: ingestion workers invalidate users while requests look up and store answers.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, ttl=ANSWER_CACHE_TTL, max_entries=ANSWER_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # entry_id -> (user_id, query, unit embedding, answer, expires_at), in LRU order
+        self.by_user = {}             # user_id -> set of entry ids
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _remove(self, entry_id):
+        user_id = self.entries.pop(entry_id)[0]
+        ids = self.by_user.get(user_id)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self.by_user[user_id]
+
+    def lookup(self, user_id: str, embedding):
+        """Returns the cached answer for a near-identical question, or None."""
+        query = self._normalize(embedding)
+        with self.lock:
+            ids = list(self.by_user.get(user_id, ()))
+            now = time.time()
+            for entry_id in ids:
+                if self.entries[entry_id][4] < now:
+                    self._remove(entry_id)
+            ids = [i for i in ids if i in self.entries]
+            if not ids:
+                self.misses += 1
+                return None
+
+            matrix = np.stack([self.entries[i][2] for i in ids])
+            sims = matrix @ query
+            best = int(np.argmax(sims))
+            if sims[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = ids[best]
+            self.entries.move_to_end(entry_id)
+            self.hits += 1
+            answer = self.entries[entry_id][3]
+        print(f"DEBUG: Answer cache hit (similarity {sims[best]:.3f})")
+        return answer
+
+    def store(self, user_id: str, query: str, embedding, answer: str):
+        entry_id = uuid.uuid4().hex
+        vec = self._normalize(embedding)
+        with self.lock:
+            self.entries[entry_id] = (user_id, query, vec, answer, time.time() + self.ttl)
+            self.by_user.setdefault(user_id, set()).add(entry_id)
+            while len(self.entries) > self.max_entries:
+                self._remove(next(iter(self.entries)))
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: str):
+        """Drops every cached answer of a user (e.g. after they upload a new document)."""
+        with self.lock:
+            for entry_id in list(self.by_user.get(user_id, ())):
+                self._remove(entry_id)
+            self.invalidations += 1
+
+    def stats(self):
+        with self.lock:
+            entries = len(self.entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": ANSWER_CACHE_ENABLED,
+            "threshold": self.threshold,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+answer_cache = SemanticAnswerCache()
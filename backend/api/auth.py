@@ -3,10 +3,9 @@ from pydantic import BaseModel
 import os
 import jwt
 from datetime import datetime, timedelta
-from database import UserDatabase
+from database import db
 
 router = APIRouter()
-db = UserDatabase()
 
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this")
 ALGORITHM = "HS256"
@@ -1,46 +1,79 @@
 from fastapi import APIRouter, HTTPException, Header
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from typing import Optional
 import os
 from dotenv import load_dotenv
 
-from database import UserDatabase
+from database import db
 from api.auth import verify_token
 
 import re #using it to find xml.
+import asyncio
 import json
-from langchain_core.messages import AIMessage, SystemMessage, HumanMessage  #systemMessage is instruction to the model.
+import time
+import uuid
+from langchain_core.messages import AIMessage, SystemMessage, HumanMessage, ToolMessage  #systemMessage is instruction to the model.
 from langchain_groq import ChatGroq
 from langgraph.graph import StateGraph, MessagesState, END
-from langgraph.prebuilt import ToolNode, tools_condition 
 from mem0 import Memory
-from tools import tools_list
+from vector_store import QDRANT_URL, QDRANT_API_KEY
+from web_search import web_search_client
+from retrieval_policy import retrieval_stats
+from context_compression import compression_stats
+from tools import tools_list, prefetch_candidates, user_has_documents, rerank_batcher
+from embeddings import embedding_service
+from concurrency import run_in_model_executor
+from write_behind import persistence_queue
+from answer_cache import answer_cache, ANSWER_CACHE_ENABLED
+from llm_scheduler import llm_scheduler, estimate_tokens, is_rate_limit_error, INTERACTIVE, BACKGROUND
+from langchain_core.runnables import RunnableConfig
+from intent_router import IntentRouter, INTENT_ROUTER_ENABLED, TIME, DOCUMENTS, SMALLTALK
+from telemetry import span, start_trace, finish_trace, record_llm_usage, stage_latency, cache_lookups, errors, requests
 
 
 load_dotenv()
 
 router = APIRouter()
-db = UserDatabase()
 
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
 
+# Run memory search and a knowledge base candidate search in parallel at request start
+SPECULATIVE_PREFETCH = os.getenv("SPECULATIVE_PREFETCH", "false").lower() == "true"
+
+# hard per-request limits, so a confused model cannot loop on tools
+MAX_AGENT_ITERATIONS = int(os.getenv("MAX_AGENT_ITERATIONS", "3"))  # LLM turns; the last one gets no tools
+MAX_TOOL_CALLS = int(os.getenv("MAX_TOOL_CALLS", "4"))
+
+# final answer when the model still asks for tools after its last allowed turn
+TOOL_BUDGET_MESSAGE = (
+    "I ran out of lookups for this question before I could put an answer together. "
+    "Please try asking it again, a bit more specifically."
+)
+
+# answers that used these tools depend on when they were asked, so they are never cached
+UNCACHEABLE_TOOLS = {"web_search", "get_current_time"}
+
 MODEL_NAME = "llama-3.3-70b-versatile"
+MEM0_ADD_REQUESTS = 2  # Groq calls per mem0.add: fact extraction, then the memory update
 llm = ChatGroq(
     model=MODEL_NAME, 
     api_key=os.getenv("GROQ_API_KEY"),
     temperature=0.3,
+    max_retries=0,  # retries are handled by llm_scheduler so they respect the shared quota
 )
 llm_with_tools = llm.bind_tools(tools_list)
 
 config = {
     "version": "v1.1",
-    "embedder": {
-        "provider": "huggingface",
+    "embedder": { #reuses the process-wide MiniLM instead of loading a third copy
+        "provider": "langchain",
         "config": {
-            "api_key": os.getenv("HUGGINGFACEHUB_API_TOKEN"),
-            "model": "sentence-transformers/all-MiniLM-L6-v2"
+            "model": embedding_service,
+            "embedding_dims": embedding_service.dimension,
         }
     },
     "llm": { #decide what mem0 will remember about user and its prefrences.
@@ -53,15 +86,28 @@ config = {
     "vector_store": {
         "provider": "qdrant",
         "config": {
-            "host": "localhost",
-            "port": 6333,
+            "url": QDRANT_URL,
+            "api_key": QDRANT_API_KEY,
             "collection_name": "chat_memory",
+            "embedding_model_dims": embedding_service.dimension,
         }
     }
 }
 
 print("DEBUG: Connecting to Memory...")
 mem_client = Memory.from_config(config)
+# Mem0's Groq client retries rate limits on its own (twice by default), outside the scheduler's budget
+mem_client.llm.client = mem_client.llm.client.with_options(max_retries=0)
+
+intent_router = IntentRouter(embedding_service)
+
+tools_by_name = {t.name: t for t in tools_list}
+
+class AgentState(MessagesState):
+    route: Optional[str]  # intent picked by the local router, None if the LLM decides
+    iterations: int       # LLM turns taken so far
+    tool_calls_made: int  # tools actually executed so far
+    seen_tool_calls: dict # "name + args" -> result, to answer repeated calls without running them
 
 def normalize_tool_calls(state: MessagesState):
     """Fixes Groq's XML tool formatting to match LangChain's JSON expectation."""
@@ -72,59 +118,201 @@ def normalize_tool_calls(state: MessagesState):
 
     content = last.content or ""
     # It looks for "<function=", then captures the tool name, then captures the JSON arguments inside {}
-    match = re.search(r'<function=([a-zA-Z0-9_\-]+)\s*(\{[\s\S]*?\})?>', content)
-    if not match:
+    matches = list(re.finditer(r'<function=([a-zA-Z0-9_\-]+)\s*(\{[\s\S]*?\})?>', content))
+    if not matches:
         return state
 
-    tool_name = match.group(1)
-    args_raw = match.group(2)
-    try:
-        args = json.loads(args_raw) if args_raw else {}
-    except:
-        args = {}
+    tool_calls = []
+    for match in matches:
+        tool_name = match.group(1)
+        args_raw = match.group(2)
+        try:
+            args = json.loads(args_raw) if args_raw else {}
+        except:
+            args = {}
+        tool_calls.append({"name": tool_name, "args": args, "id": f"call_{uuid.uuid4().hex}"})
 
     new_message = AIMessage(
         content=last.content,
-        tool_calls=[{"name": tool_name, "args": args}]
+        tool_calls=tool_calls,
+        id=last.id,  # same id, so it replaces the original message instead of being appended
     )
-    state["messages"][-1] = new_message
-    return {"messages": state["messages"]}
+    return {"messages": [new_message]}
 
-def reasoner(state: MessagesState):
+def tool_call_key(call: dict):
+    return call["name"] + json.dumps(call.get("args", {}), sort_keys=True)
+
+async def run_tool_call(call: dict, config: RunnableConfig):
+    tool = tools_by_name.get(call["name"])
+    if tool is None:
+        return ToolMessage(content=f"Error: unknown tool '{call['name']}'.", name=call["name"], tool_call_id=call["id"])
+    try:
+        with span(f"tool_{call['name']}"):
+            return await tool.ainvoke({**call, "type": "tool_call"}, config=config)
+    except Exception as e:
+        return ToolMessage(content=f"Error: {str(e)}", name=call["name"], tool_call_id=call["id"])
+
+async def execute_tools(state: AgentState, config: RunnableConfig):
+    """
+    Runs every tool call of the last AI turn concurrently.
+    Calls already made earlier in this request are answered from their previous result,
+    and calls over the MAX_TOOL_CALLS budget are refused instead of executed.
+    """
+    calls = state["messages"][-1].tool_calls
+    seen = dict(state.get("seen_tool_calls") or {})
+    made = state.get("tool_calls_made", 0)
+
+    results = {}
+    to_run = {}   # "name + args" -> first call with those arguments in this turn
+    repeats = []  # calls answered with the result of an identical call
+    for call in calls:
+        key = tool_call_key(call)
+        if key in seen or key in to_run:
+            repeats.append((call, key))
+        elif made + len(to_run) >= MAX_TOOL_CALLS:
+            results[call["id"]] = ToolMessage(
+                content="Tool budget for this question is used up. Answer with the information you already have.",
+                name=call["name"], tool_call_id=call["id"],
+            )
+        else:
+            to_run[key] = call
+
+    outputs = await asyncio.gather(*(run_tool_call(call, config) for call in to_run.values()))
+    for (key, call), output in zip(to_run.items(), outputs):
+        seen[key] = output.content
+        results[call["id"]] = output
+    for call, key in repeats:
+        print(f"DEBUG: Skipping repeated tool call {call['name']}")
+        results[call["id"]] = ToolMessage(
+            content=f"(Already called with the same arguments, result repeated)\n{seen[key]}",
+            name=call["name"], tool_call_id=call["id"],
+        )
+
+    return {
+        "messages": [results[call["id"]] for call in calls],
+        "tool_calls_made": made + len(to_run),
+        "seen_tool_calls": seen,
+    }
+
+def should_continue(state: AgentState):
+    last = state["messages"][-1]
+    if not isinstance(last, AIMessage) or not last.tool_calls:
+        return END
+    if state.get("iterations", 0) >= MAX_AGENT_ITERATIONS:
+        print("DEBUG: Agent iteration budget reached, stopping")
+        return "budget_exhausted"
+    return "tools"
+
+def budget_exhausted(state: AgentState):
+    """Ends a run whose last turn was still a tool call, so that message never becomes the answer."""
+    return {"messages": [AIMessage(content=TOOL_BUDGET_MESSAGE)]}
+
+def local_tool_call(name: str, args: dict):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"local_{uuid.uuid4().hex}"}])
+
+async def route_intent(state: AgentState, config: RunnableConfig):
+    """
+    Cheap local routing before the first LLM call: obvious time and document questions
+    call their tool directly, small talk is answered without tools.
+    """
+    if not INTENT_ROUTER_ENABLED:
+        return {"route": None}
+    configurable = config.get("configurable", {})
+    query = state["messages"][-1].content
+    try:
+        with span("intent_routing"):
+            intent = await intent_router.route(
+                query,
+                configurable.get("user_id"),
+                has_documents=lambda uid: run_in_threadpool(user_has_documents, uid),
+                embedding=configurable.get("query_embedding"),
+            )
+    except Exception as e:
+        print(f"DEBUG: Intent routing failed: {e}")
+        intent = None
+
+    if intent == TIME:
+        return {"route": intent, "messages": [local_tool_call("get_current_time", {})]}
+    if intent == DOCUMENTS:
+        return {"route": intent, "messages": [local_tool_call("search_knowledge_base", {"query": query})]}
+    return {"route": intent}
+
+def after_routing(state: AgentState):
+    last = state["messages"][-1]
+    return "tools" if isinstance(last, AIMessage) and last.tool_calls else "agent"
+
+async def reasoner(state: AgentState, config: RunnableConfig):
     """The main thinking node for the AI."""
+    user_id = config.get("configurable", {}).get("user_id", "anonymous")
+    iterations = state.get("iterations", 0) + 1
+    out_of_budget = iterations >= MAX_AGENT_ITERATIONS or state.get("tool_calls_made", 0) >= MAX_TOOL_CALLS
+    # small talk needs no tools, and the last allowed turn must answer, so neither gets tools bound
+    model = llm if state.get("route") == SMALLTALK or out_of_budget else llm_with_tools
+    async def call_model():
+        with span("llm_call"):
+            return await model.ainvoke(state["messages"], config=config)
+
     # Take the entire history of the conversation from the flowchart's state
-    # Hand it to the LLM (which has tools attached to it)
-    response = llm_with_tools.invoke(state["messages"])
+    # Hand it to the LLM (which has tools attached to it), once the Groq budget allows
+    response = await llm_scheduler.run(
+        call_model,
+        user_id=user_id,
+        priority=INTERACTIVE,
+        tokens=estimate_tokens(state["messages"]),
+    )
+    record_llm_usage(response)
     # Take the AI's new reply, add it to the list of messages, 
     # and send it back to the flowchart
-    return {"messages":  [response]}
+    return {"messages":  [response], "iterations": iterations}
 
 
-workflow = StateGraph(MessagesState)
+workflow = StateGraph(AgentState)
+workflow.add_node("router", route_intent)
 workflow.add_node("agent", reasoner)
-workflow.add_node("tools", ToolNode(tools_list))
+workflow.add_node("tools", execute_tools)
 workflow.add_node("normalize", normalize_tool_calls)
+workflow.add_node("budget_exhausted", budget_exhausted)
 
-workflow.set_entry_point("agent")
+workflow.set_entry_point("router")
+workflow.add_conditional_edges("router", after_routing, ["tools", "agent"])
 workflow.add_edge("agent", "normalize")
-workflow.add_conditional_edges("normalize", tools_condition) #tools condition is pre defined if the normalize node send a tool call it understnand and call the tool.
+workflow.add_conditional_edges("normalize", should_continue, ["tools", "budget_exhausted", END]) #goes to tools only while the per-request budget allows.
 workflow.add_edge("tools", "agent")
+workflow.add_edge("budget_exhausted", END)
 
 agent_app = workflow.compile()
 
 
+@router.get("/chat/stats")
+async def chat_stats():
+    """Counters for tuning the chat pipeline (answer cache hit rate, LLM queue etc.)."""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "intent_router": intent_router.stats(),
+        "embeddings": embedding_service.stats(),
+        "batching": {
+            "embed": embedding_service.batcher.stats(),
+            "embed_docs": embedding_service.document_batcher.stats(),
+            "rerank": rerank_batcher.stats(),
+        },
+        "web_search": web_search_client.stats(),
+        "retrieval": retrieval_stats(),
+        "context_compression": compression_stats(),
+    }
+
 @router.get("/conversations")
 async def get_conversations(authorization: Optional[str] = Header(None)): #telling that look only in header it can be or can not be present if not dont crash.
     """Fetches a list of all chat histories for the logged-in user."""
     user_id, username = verify_token(authorization)
-    conversations = db.get_conversations(user_id)
+    conversations = await run_in_threadpool(db.get_conversations, user_id)
     return {"conversations": conversations}
 
 @router.post("/conversations")
 async def create_conversation(authorization: Optional[str] = Header(None)):
     """Creates a brand new, empty chat thread."""
     user_id, username = verify_token(authorization)
-    conv_id = db.create_conversation(user_id)
+    conv_id = await run_in_threadpool(db.create_conversation, user_id)
     if conv_id:
         return {"conversation_id": conv_id, "message": "Conversation created"}
     raise HTTPException(status_code=500, detail="Failed to create conversation")
@@ -133,7 +321,7 @@ async def create_conversation(authorization: Optional[str] = Header(None)):
 async def get_conversation(conversation_id: str, authorization: Optional[str] = Header(None)):
     """Loads all the messages inside a specific chat thread."""
     user_id, username = verify_token(authorization)
-    conversation = db.get_conversation(conversation_id, user_id)
+    conversation = await run_in_threadpool(db.get_conversation, conversation_id, user_id)
     if conversation:
         return conversation
     raise HTTPException(status_code=404, detail="Conversation not found")
@@ -142,26 +330,18 @@ async def get_conversation(conversation_id: str, authorization: Optional[str] =
 async def delete_conversation(conversation_id: str, authorization: Optional[str] = Header(None)):
     """Deletes a specific chat thread from the database."""
     user_id, username = verify_token(authorization)
-    success = db.delete_conversation(conversation_id, user_id)
+    success = await run_in_threadpool(db.delete_conversation, conversation_id, user_id)
     if success:
         return {"message": "Conversation deleted"}
     raise HTTPException(status_code=500, detail="Failed to delete conversation")
 
-@router.post("/chat")
-async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Header(None)):
-    user_id, username = verify_token(authorization)
-    user_query = request.message
-    conv_id = request.conversation_id 
-
-    if not conv_id:
-        conv_id = db.create_conversation(user_id)
-        if not conv_id:
-            raise HTTPException(status_code=500, detail="Failed to create conversation")
-
-    #  Memory Retrieval: Ask Mem0 if it knows anything relevant about this user
+async def retrieve_memories(user_query: str, user_id: str):
+    """Asks Mem0 if it knows anything relevant about this user."""
     memories = []
     try:
-        search_results = mem_client.search(query=user_query, user_id=user_id, limit=3)
+        # mem0 embeds the query locally, so this goes to the model executor
+        with span("memory_search"):
+            search_results = await run_in_model_executor(mem_client.search, query=user_query, user_id=user_id, limit=3)
         if search_results:
             raw = search_results if isinstance(search_results, list) else search_results.get("results", [])
             for mem in raw:
@@ -171,7 +351,27 @@ async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Hea
                     memories.append(text)
     except Exception as e:
         print(f"DEBUG: Memory Error: {e}")
+    return memories
+
+async def gather_context(user_query: str, user_id: str, query_embedding=None):
+    """
+    Returns (memories, run config) for the agent. In speculative mode the knowledge base
+    candidates for the raw message are fetched alongside the memories, so search_knowledge_base
+    can skip its own embedding + Qdrant round trip if the agent searches for the same thing.
+    """
+    configurable = {"user_id": user_id, "query_embedding": query_embedding}
+    if SPECULATIVE_PREFETCH:
+        memories, prefetched = await asyncio.gather(
+            retrieve_memories(user_query, user_id),
+            prefetch_candidates(user_query, user_id),
+        )
+        configurable["prefetched"] = prefetched
+    else:
+        memories = await retrieve_memories(user_query, user_id)
+    return memories, {"configurable": configurable}
 
+def build_input_messages(user_query: str, memories: list):
+    """Builds the system prompt (with any recalled memories) and the user's message."""
     base_prompt = (
         "You are a helpful assistant. "
         "You have three tools available:\n"
@@ -190,33 +390,214 @@ async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Hea
     else:
         SYSTEM_PROMPT = base_prompt
 
-    input_messages = [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=user_query)]
+    return [SystemMessage(content=SYSTEM_PROMPT), HumanMessage(content=user_query)]
+
+def save_history(conv_id: str, user_id: str, user_query: str, ai_response: str):
+    with span("sqlite_write"):
+        saved = db.add_message_to_conversation(conv_id, user_id, user_query, ai_response)
+    if not saved:
+        raise RuntimeError(f"Failed to save to SQL for conversation {conv_id}")
+
+async def save_memory(user_id: str, user_query: str, ai_response: str):
+    # mem0.add makes its own Groq calls (fact extraction + memory update), so it queues
+    # behind interactive chats in the same budget and counts as MEM0_ADD_REQUESTS requests
+    messages = [{"role": "user", "content": user_query}, {"role": "assistant", "content": ai_response}]
+
+    async def add_memory():
+        with span("mem0_add"):
+            return await run_in_threadpool(mem_client.add, user_id=user_id, messages=messages)
+
+    await llm_scheduler.run(
+        add_memory,
+        user_id=user_id,
+        priority=BACKGROUND,
+        tokens=MEM0_ADD_REQUESTS * estimate_tokens([user_query, ai_response]),
+        requests=MEM0_ADD_REQUESTS,
+    )
+
+async def save_exchange(conv_id: str, user_id: str, user_query: str, ai_response: str):
+    """
+    Queues the finished turn for SQLite (UI history) and Mem0 (long-term memory).
+    Both run in the background so the response does not wait for them.
+    """
+    await persistence_queue.submit(f"sql:{conv_id}", save_history, conv_id, user_id, user_query, ai_response)
+
+    # Save Long-Term Memory (to Mem0/Qdrant for future AI context)
+    await persistence_queue.submit(f"mem0:{user_id}", save_memory, user_id, user_query, ai_response)
+
+async def lookup_cached_answer(user_query: str, user_id: str):
+    """Returns (cached answer or None, query embedding) from the per-user semantic cache."""
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    try:
+        with span("query_embedding"):
+            embedding = await run_in_model_executor(embedding_service.embed_query, user_query)
+    except Exception as e:
+        print(f"DEBUG: Answer cache embedding failed: {e}")
+        return None, None
+    cached = answer_cache.lookup(user_id, embedding)
+    cache_lookups.inc(cache="answer", result="hit" if cached else "miss")
+    return cached, embedding
+
+def cache_answer(user_id: str, user_query: str, embedding, ai_response: str, tools_used: set):
+    if embedding is None or not ai_response or ai_response == TOOL_BUDGET_MESSAGE or tools_used & UNCACHEABLE_TOOLS:
+        return
+    answer_cache.store(user_id, user_query, embedding, ai_response)
+
+def friendly_error(e: Exception):
+    errors.inc(stage="chat")
+    error_msg = str(e)
+    if is_rate_limit_error(e):
+        return "I am thinking too hard. Please wait 30 seconds."
+    return f"System Error: {error_msg}"
+
+def sse_event(event: str, data: dict):
+    """Formats one Server-Sent Event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/chat")
+async def chat_endpoint(request: ChatRequest, authorization: Optional[str] = Header(None)):
+    user_id, username = verify_token(authorization)
+    requests.inc(endpoint="chat")
+    trace = start_trace("chat_request")
+    user_query = request.message
+    conv_id = request.conversation_id 
+
+    if not conv_id:
+        conv_id = await run_in_threadpool(db.create_conversation, user_id)
+        if not conv_id:
+            raise HTTPException(status_code=500, detail="Failed to create conversation")
+
+    cached, query_embedding = await lookup_cached_answer(user_query, user_id)
+    if cached:
+        await save_exchange(conv_id, user_id, user_query, cached)
+        finish_trace(trace, cached=True)
+        return {"response": cached, "conversation_id": conv_id, "cached": True}
+
+    memories, run_config = await gather_context(user_query, user_id, query_embedding)
+    input_messages = build_input_messages(user_query, memories)
     
     # 5. Execution: Run the LangGraph AI (with the Secret Tunnel for Data Privacy!)
     try:
-        final_state = agent_app.invoke(
+        final_state = await agent_app.ainvoke(
             {"messages": input_messages},
-            config={"configurable": {"user_id": user_id}}
+            config=run_config
         )
         
         ai_response = final_state["messages"][-1].content
+        tools_used = {m.name for m in final_state["messages"] if isinstance(m, ToolMessage)}
 
-       
-        try:
-            db.add_message_to_conversation(conv_id, user_id, user_query, ai_response)
-        except Exception as conv_err:
-            print(f"DEBUG: Failed to save to SQL: {conv_err}")
-        
-        # Save Long-Term Memory (to Mem0/Qdrant for future AI context)
-        try:
-            mem_client.add(user_id=user_id, messages=[{"role": "user", "content": user_query}, {"role": "assistant", "content": ai_response}])
-        except Exception as mem_err:
-            print(f"DEBUG: Failed to save to Mem0: {mem_err}")
+        await save_exchange(conv_id, user_id, user_query, ai_response)
+        cache_answer(user_id, user_query, query_embedding, ai_response, tools_used)
         
+        finish_trace(trace, tools=sorted(tools_used))
         return {"response": ai_response, "conversation_id": conv_id}
         
     except Exception as e:
-        error_msg = str(e)
-        if "rate_limit" in error_msg.lower() or "413" in error_msg:
-            return {"response": "I am thinking too hard. Please wait 30 seconds."}
-        return {"response": f"System Error: {error_msg}"}
\ No newline at end of file
+        finish_trace(trace, error=str(e))
+        return {"response": friendly_error(e)}
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(request: ChatRequest, authorization: Optional[str] = Header(None)):
+    """
+    Same as /chat but streams the answer as Server-Sent Events:
+    'start' -> ('tool_start' | 'tool_end' | 'token' | 'reset')* -> 'done' (or 'error').
+    """
+    user_id, username = verify_token(authorization)
+    requests.inc(endpoint="chat_stream")
+    trace = start_trace("chat_stream_request")
+    started = time.perf_counter()
+    user_query = request.message
+    conv_id = request.conversation_id
+
+    if not conv_id:
+        conv_id = await run_in_threadpool(db.create_conversation, user_id)
+        if not conv_id:
+            raise HTTPException(status_code=500, detail="Failed to create conversation")
+
+    cached, query_embedding = await lookup_cached_answer(user_query, user_id)
+    if cached:
+        async def cached_stream():
+            yield sse_event("start", {"conversation_id": conv_id})
+            await save_exchange(conv_id, user_id, user_query, cached)
+            yield sse_event("token", {"content": cached})
+            yield sse_event("done", {"response": cached, "conversation_id": conv_id, "cached": True})
+            finish_trace(trace, cached=True)
+
+        return StreamingResponse(cached_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    memories, run_config = await gather_context(user_query, user_id, query_embedding)
+    input_messages = build_input_messages(user_query, memories)
+
+    async def event_stream():
+        yield sse_event("start", {"conversation_id": conv_id})
+
+        ai_response = ""
+        tools_used = set()
+        turn_text = ""   # text of the current agent turn
+        sent = 0         # how much of turn_text the client already has
+        first_token = True
+        try:
+            async for event in agent_app.astream_events(
+                {"messages": input_messages},
+                config=run_config,
+                version="v2",
+            ):
+                kind = event["event"]
+                node = event.get("metadata", {}).get("langgraph_node")
+
+                if kind == "on_chat_model_start" and node == "agent":
+                    turn_text, sent = "", 0
+
+                elif kind == "on_chat_model_stream" and node == "agent":
+                    token = event["data"]["chunk"].content
+                    if not isinstance(token, str) or not token:
+                        continue
+                    turn_text += token
+                    # Groq sometimes writes tool calls as "<function=...>" text; hold those back.
+                    stripped = turn_text.lstrip()
+                    if stripped.startswith("<function") or "<function".startswith(stripped):
+                        continue
+                    if first_token:
+                        stage_latency.observe(time.perf_counter() - started, stage="time_to_first_token")
+                        first_token = False
+                    yield sse_event("token", {"content": turn_text[sent:]})
+                    sent = len(turn_text)
+
+                elif kind == "on_chat_model_end" and node == "agent":
+                    output = event["data"].get("output")
+                    content = getattr(output, "content", "") or ""
+                    if getattr(output, "tool_calls", None) or "<function=" in content:
+                        # This turn was a tool call, not the answer: drop what the client rendered.
+                        if sent:
+                            yield sse_event("reset", {})
+                        turn_text, sent = "", 0
+                    else:
+                        ai_response = content
+
+                elif kind == "on_chain_end" and event["name"] == "budget_exhausted":
+                    ai_response = TOOL_BUDGET_MESSAGE
+                    yield sse_event("token", {"content": ai_response})
+
+                elif kind == "on_tool_start":
+                    tools_used.add(event["name"])
+                    yield sse_event("tool_start", {"name": event["name"], "input": event["data"].get("input")})
+
+                elif kind == "on_tool_end":
+                    yield sse_event("tool_end", {"name": event["name"]})
+
+        except Exception as e:
+            finish_trace(trace, error=str(e))
+            yield sse_event("error", {"response": friendly_error(e)})
+            return
+
+        await save_exchange(conv_id, user_id, user_query, ai_response)
+        cache_answer(user_id, user_query, query_embedding, ai_response, tools_used)
+        finish_trace(trace, tools=sorted(tools_used))
+        yield sse_event("done", {"response": ai_response, "conversation_id": conv_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
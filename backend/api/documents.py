@@ -1,16 +1,15 @@
-from fastapi import APIRouter, File, UploadFile, Header
-from typing import Optional
-from langchain_huggingface import HuggingFaceEmbeddings
-from file_processor import process_and_ingest_document
+import os
+from fastapi import APIRouter, File, UploadFile, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from typing import List, Optional
 from api.auth import verify_token
+from database import db
+from ingestion_jobs import ingestion_queue
 
 
 router = APIRouter()
 
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-
 @router.post("/upload-doc")
 async def upload_and_ingest(
     file: UploadFile=File(...),
@@ -19,16 +18,47 @@ async def upload_and_ingest(
         try:
             user_id, username=verify_token(authorization)
 
-            success,message=process_and_ingest_document(
-                file_obj=file.file,
-                filename=file.filename,
-                embedding_model=embedding_model,
-                user_id=user_id
+            # parsing + embedding can take minutes, so only spool the file here and let a worker do the rest
+            job_id=await run_in_threadpool(ingestion_queue.submit, user_id, os.path.basename(file.filename), file.file)
+            return JSONResponse(
+                status_code=202,
+                content={"status": "accepted", "job_id": job_id, "message": f"{file.filename} is being processed"},
             )
-            if success:
-                return {"status": "success", "message": message}
-            else:
-                return {"status": "error", "message": message}
 
         except Exception as e:
-            return {"status": "error", "message": str(e)}
\ No newline at end of file
+            return {"status": "error", "message": str(e)}
+
+@router.post("/upload-docs")
+async def bulk_upload_and_ingest(
+    files: List[UploadFile]=File(...),
+    authorization: Optional[str]=Header(None)
+    ):
+        """Many files (or zips of files) at once; each document gets its own job id."""
+        try:
+            user_id, username=verify_token(authorization)
+
+            jobs,skipped=await run_in_threadpool(
+                ingestion_queue.submit_many, user_id, [(f.filename, f.file) for f in files]
+            )
+            return JSONResponse(
+                status_code=202,
+                content={
+                    "status": "accepted",
+                    "jobs": [{"job_id": job_id, "filename": name} for job_id, name in jobs],
+                    "skipped": skipped,
+                    "message": f"{len(jobs)} documents are being processed",
+                },
+            )
+
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
+
+@router.get("/upload-doc/{job_id}")
+async def get_upload_status(job_id: str, authorization: Optional[str]=Header(None)):
+    """Stage, pages/chunks processed and error message of an ingestion job."""
+    user_id, username=verify_token(authorization)
+    job=await run_in_threadpool(db.get_ingestion_job, job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    job.pop("file_path", None)
+    return job
@@ -0,0 +1,151 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "true").lower() == "true"
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "5"))
+
+
+class MicroBatcher:
+    """
+    Collects model calls from concurrent callers and runs them as one batched forward pass.
+
+    Callers (model executor threads) block in submit() while a single batching thread gathers
+    requests for up to max_wait_ms or until max_batch_size items are waiting, calls batch_fn once,
+    and hands every caller its own slice of the result. When nobody else is in flight the batch
+    runs immediately, so a lone request never pays the wait.
+
+    `weight` says how many model inputs one request carries (e.g. number of rerank pairs).
+    """
+
+    def __init__(self, name, batch_fn, max_batch_size=32, max_wait_ms=MICROBATCH_MAX_WAIT_MS, weight=lambda item: 1):
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.weight = weight
+        self.queue = queue.Queue()
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.thread = None
+
+        self.batches = 0
+        self.items = 0
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._loop, name=f"batcher-{self.name}", daemon=True)
+                    self.thread.start()
+
+    def submit(self, item):
+        """Blocks until the batch containing `item` has run, then returns its result."""
+        if not MICROBATCH_ENABLED:
+            return self.batch_fn([item])[0]
+        self._ensure_thread()
+        future = Future()
+        with self.lock:
+            self.in_flight += 1
+        self.queue.put((item, future))
+        try:
+            return future.result()
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        size = self.weight(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                with self.lock:
+                    alone = self.in_flight <= len(batch)
+                remaining = deadline - time.monotonic()
+                if alone or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            batch.append(item)
+            size += self.weight(item[0])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            "enabled": MICROBATCH_ENABLED,
+            "batches": self.batches,
+            "requests": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+def split_by_lengths(flat, lengths):
+    """Inverse of concatenating per-caller lists: cuts `flat` back into pieces of the given lengths."""
+    out, start = [], 0
+    for n in lengths:
+        out.append(flat[start:start + n])
+        start += n
+    return out
+
+
+if __name__ == "__main__":
+    # Throughput/latency of the real models with and without batching:  python batching.py
+    from concurrent.futures import ThreadPoolExecutor
+    from embeddings import embedding_service
+    from tools import reranker, rerank_batcher
+
+    query = "what experience does the candidate have with distributed systems"
+    docs = [f"Snippet {i}: worked on a team building services, databases and caching layers." for i in range(15)]
+    pairs = [[query, d] for d in docs]
+
+    def embed(i):
+        return embedding_service.model.embed_query(f"{query} {i}")
+
+    def embed_batched(i):
+        return embedding_service.batcher.submit([f"{query} {i}"])
+
+    def rerank(i):
+        return reranker.predict(pairs)
+
+    def rerank_batched(i):
+        return rerank_batcher.submit(pairs)
+
+    for label, unbatched, batched, total in (("embed", embed, embed_batched, 256), ("rerank", rerank, rerank_batched, 64)):
+        for concurrency in (1, 8, 32):
+            for mode, fn in (("plain", unbatched), ("batched", batched)):
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    latencies = []
+
+                    def timed(i):
+                        t = time.perf_counter()
+                        fn(i)
+                        latencies.append(time.perf_counter() - t)
+
+                    started = time.perf_counter()
+                    list(pool.map(timed, range(total)))
+                    elapsed = time.perf_counter() - started
+                latencies.sort()
+                print(f"{label:6s} c={concurrency:<3d} {mode:8s} {total / elapsed:8.1f} req/s  "
+                      f"p50={latencies[len(latencies) // 2] * 1000:7.1f}ms  p95={latencies[int(len(latencies) * 0.95)] * 1000:7.1f}ms")
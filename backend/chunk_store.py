@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+
+CHUNK_STORE_ENABLED = os.getenv("CHUNK_STORE_ENABLED", "true").lower() == "true"
+CHUNK_STORE_DIR = os.getenv("CHUNK_STORE_DIR", os.path.join(os.path.dirname(__file__), "data", "chunk_store"))
+
+
+class ChunkStore:
+    """
+    Source of truth for the knowledge base: every stored chunk with the float32 embedding it was
+    indexed with, one directory per user:
+
+      user.json      {"user_id", "dim"}
+      vectors.f32    raw embeddings, one row per chunk, appended (read back through np.memmap)
+      chunks.jsonl   {"id", "page_content", "metadata"} per row
+      deleted.txt    ids removed since they were written
+
+    Any vector collection can be rebuilt from here without parsing or embedding again (see reindex).
+    A row is two appends (vectors.f32, then chunks.jsonl), so a crash can leave the files out of step:
+    readers only use the rows both files hold completely, and the first append of a process cuts the
+    files back to those rows before writing.
+    """
+
+    def __init__(self, root=CHUNK_STORE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+        self.repaired = set()  # user directories checked by this process
+
+    def _dir(self, user_id):
+        return os.path.join(self.root, hashlib.sha1(str(user_id).encode()).hexdigest()[:16])
+
+    @staticmethod
+    def _consistent_rows(path, dim):
+        """(rows, bytes of chunks.jsonl they use): rows with both a full vector and a complete jsonl line."""
+        vectors_path = os.path.join(path, "vectors.f32")
+        vector_rows = os.path.getsize(vectors_path) // (dim * 4) if os.path.exists(vectors_path) else 0
+        rows = size = 0
+        if os.path.exists(os.path.join(path, "chunks.jsonl")):
+            with open(os.path.join(path, "chunks.jsonl"), "rb") as f:
+                for line in f:
+                    if rows == vector_rows or not line.endswith(b"\n"):
+                        break
+                    rows += 1
+                    size += len(line)
+        return rows, size
+
+    def _repair(self, path, dim):
+        """Truncates both files to their common complete rows (call with the lock held)."""
+        rows, size = self._consistent_rows(path, dim)
+        for name, keep in (("vectors.f32", rows * dim * 4), ("chunks.jsonl", size)):
+            file_path = os.path.join(path, name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) != keep:
+                print(f"DEBUG: Chunk store {path}: truncating {name} to {rows} rows after an interrupted write")
+                os.truncate(file_path, keep)
+        self.repaired.add(path)
+
+    def append(self, user_id, ids, vectors, docs):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        path = self._dir(user_id)
+        with self.lock:
+            os.makedirs(path, exist_ok=True)
+            meta_path = os.path.join(path, "user.json")
+            if not os.path.exists(meta_path):
+                with open(meta_path, "w") as f:
+                    json.dump({"user_id": user_id, "dim": vectors.shape[1]}, f)
+            if path not in self.repaired:
+                with open(meta_path) as f:
+                    self._repair(path, json.load(f)["dim"])
+            with open(os.path.join(path, "vectors.f32"), "ab") as f:
+                f.write(vectors.tobytes())
+            with open(os.path.join(path, "chunks.jsonl"), "a") as f:
+                for chunk_id, doc in zip(ids, docs):
+                    f.write(json.dumps({"id": chunk_id, "page_content": doc.page_content, "metadata": doc.metadata}, default=str) + "\n")
+
+    def delete(self, user_id, ids):
+        path = self._dir(user_id)
+        if not os.path.isdir(path):
+            return
+        with self.lock:
+            with open(os.path.join(path, "deleted.txt"), "a") as f:
+                f.writelines(f"{chunk_id}\n" for chunk_id in ids)
+
+    def users(self):
+        """user_id -> embedding dimension for every user with stored chunks."""
+        found = {}
+        if not os.path.isdir(self.root):
+            return found
+        for name in os.listdir(self.root):
+            if name.startswith("."):
+                continue
+            meta_path = os.path.join(self.root, name, "user.json")
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                found[meta["user_id"]] = meta["dim"]
+        return found
+
+    def iter_batches(self, user_id, batch_size=1024):
+        """Yields (ids, float32 matrix, Documents) of the user's live chunks, newest version of each id."""
+        path = self._dir(user_id)
+        if not os.path.exists(os.path.join(path, "user.json")):
+            return
+        with open(os.path.join(path, "user.json")) as f:
+            dim = json.load(f)["dim"]
+        deleted = set()
+        if os.path.exists(os.path.join(path, "deleted.txt")):
+            with open(os.path.join(path, "deleted.txt")) as f:
+                deleted = {line.rstrip("\n") for line in f}
+
+        # rows past a torn write (or still being appended by another process) are left out
+        rows, _ = self._consistent_rows(path, dim)
+        if not rows:
+            return
+
+        # first pass: ids only, to find the live rows; texts are read in the second pass batch by batch
+        latest = {}
+        with open(os.path.join(path, "chunks.jsonl")) as f:
+            for row, line in zip(range(rows), f):
+                latest[json.loads(line)["id"]] = row  # an id written twice keeps its last row
+        vectors = np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(rows, dim))
+
+        batch_rows, batch_ids, batch_docs = [], [], []
+        with open(os.path.join(path, "chunks.jsonl")) as f:
+            for row, line in zip(range(rows), f):
+                record = json.loads(line)
+                if latest[record["id"]] != row or record["id"] in deleted:
+                    continue
+                batch_rows.append(row)
+                batch_ids.append(record["id"])
+                batch_docs.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+                if len(batch_rows) >= batch_size:
+                    yield batch_ids, np.asarray(vectors[batch_rows]), batch_docs
+                    batch_rows, batch_ids, batch_docs = [], [], []
+        if batch_rows:
+            yield batch_ids, np.asarray(vectors[batch_rows]), batch_docs
+
+    def compact(self, user_id):
+        """Rewrites a user's files without deleted or superseded rows (run offline, not during ingestion)."""
+        path = self._dir(user_id)
+        staging = ChunkStore(root=os.path.join(self.root, ".compact"))
+        for ids, vectors, docs in self.iter_batches(user_id):
+            staging.append(user_id, ids, vectors, docs)
+        new_path = staging._dir(user_id)
+        with self.lock:
+            for name in ("vectors.f32", "chunks.jsonl"):
+                if os.path.exists(os.path.join(new_path, name)):
+                    os.replace(os.path.join(new_path, name), os.path.join(path, name))
+                elif os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))  # nothing live is left
+            if os.path.exists(os.path.join(path, "deleted.txt")):
+                os.remove(os.path.join(path, "deleted.txt"))
+        shutil.rmtree(staging.root, ignore_errors=True)
+
+    def stats(self):
+        users = self.users()
+        size = 0
+        for user_id in users:
+            path = self._dir(user_id)
+            size += sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        return {"enabled": CHUNK_STORE_ENABLED, "users": len(users), "bytes": size}
+
+
+chunk_store = ChunkStore()
+
+
+def reindex(backend, user_ids=None, batch_size=1024, store=chunk_store):
+    """Loads every stored chunk (or only these users') into a vector backend. Returns chunks written."""
+    written = 0
+    started = time.perf_counter()
+    for user_id in user_ids or store.users():
+        for ids, vectors, docs in store.iter_batches(user_id, batch_size):
+            backend.add(user_id, ids, vectors, docs)
+            written += len(ids)
+        print(f"DEBUG: Re-indexed user {user_id} ({written} chunks so far, {time.perf_counter() - started:.1f}s)")
+    return written
+
+
+def backfill_from_qdrant(qdrant_backend, store=chunk_store, batch_size=512):
+    """Copies chunks that only exist in Qdrant (ingested before the chunk store) into the store."""
+    qdrant_backend.ensure_collection()
+    copied = 0
+    for collection in [qdrant_backend.collection_name, *sorted(qdrant_backend.dedicated)]:
+        offset = None
+        while True:
+            records, offset = qdrant_backend.client.scroll(
+                collection_name=collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            by_user = {}
+            for record in records:
+                payload = record.payload or {}
+                metadata = payload.get("metadata") or {}
+                doc = Document(page_content=payload.get("page_content", ""), metadata=metadata)
+                by_user.setdefault(metadata.get("user_id"), []).append((str(record.id), record.vector, doc))
+            for user_id, rows in by_user.items():
+                ids, vectors, docs = zip(*rows)
+                store.append(user_id, list(ids), list(vectors), list(docs))
+                copied += len(rows)
+            if offset is None:
+                break
+    return copied
+
+
+if __name__ == "__main__":
+    # python chunk_store.py reindex qdrant [collection] [user_id]  -> rebuild a Qdrant collection from the store
+    # python chunk_store.py reindex local [user_id]                -> rebuild the local memory-mapped index
+    # python chunk_store.py backfill                               -> copy chunks that only exist in Qdrant into the store
+    # python chunk_store.py compact                                -> drop deleted/superseded rows
+    # python chunk_store.py stats
+    from vector_store import QdrantVectorBackend, QDRANT_COLLECTION, QDRANT_URL, QDRANT_API_KEY
+    from local_index import LocalVectorBackend
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    if command == "reindex":
+        target = sys.argv[2] if len(sys.argv) > 2 else "qdrant"
+        dims = set(chunk_store.users().values())
+        if not dims:
+            sys.exit("chunk store is empty")
+        dim = dims.pop()
+        if target == "qdrant":
+            collection = sys.argv[3] if len(sys.argv) > 3 else QDRANT_COLLECTION
+            users = sys.argv[4:] or None
+            backend = QdrantVectorBackend(dim, collection_name=collection)
+        else:
+            users = sys.argv[3:] or None
+            backend = LocalVectorBackend(dim)
+        started = time.perf_counter()
+        written = reindex(backend, users)
+        elapsed = time.perf_counter() - started
+        print(f"{written} chunks into {target} in {elapsed:.1f}s ({written / elapsed if elapsed else 0:.0f} chunks/s)")
+    elif command == "backfill":
+        from qdrant_client import QdrantClient
+        dim = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY).get_collection(QDRANT_COLLECTION).config.params.vectors.size
+        print(f"{backfill_from_qdrant(QdrantVectorBackend(dim))} chunks copied into the chunk store")
+    elif command == "compact":
+        for user_id in chunk_store.users():
+            chunk_store.compact(user_id)
+        print(chunk_store.stats())
+    else:
+        print(chunk_store.stats())
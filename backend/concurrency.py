@@ -0,0 +1,19 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# CPU-bound model work (embeddings, CrossEncoder reranking) runs here instead of on the event loop.
+# The forward passes themselves are micro-batched on one thread per model (see batching.py), so these
+# workers mostly wait on Qdrant or a batch; the bound only has to be large enough for batches to fill.
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "16"))
+
+model_executor = ThreadPoolExecutor(max_workers=MODEL_WORKERS, thread_name_prefix="model")
+
+
+async def run_in_model_executor(func, *args, **kwargs):
+    """Runs a blocking model call on the bounded model executor and awaits the result."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()  # keeps the request trace visible inside the worker thread
+    return await loop.run_in_executor(model_executor, ctx.run, partial(func, *args, **kwargs))
@@ -0,0 +1,103 @@
+import os
+import re
+import numpy as np
+from telemetry import context_tokens, llm_tokens, requests
+
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "350"))  # knowledge-base tokens per tool call
+SENTENCE_MIN_SIMILARITY = float(os.getenv("SENTENCE_MIN_SIMILARITY", "0.1"))  # cosine to the query
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+def count_tokens(text: str):
+    # same 4-chars-per-token estimate the LLM scheduler uses
+    return len(text) // 4 + 1
+
+
+def split_sentences(text: str):
+    return [s for s in (" ".join(part.split()) for part in SENTENCE_RE.split(text)) if s]
+
+
+def source_label(metadata):
+    """'report.pdf, page 3' style attribution from the chunk metadata."""
+    source = os.path.basename(str(metadata.get("source") or "document"))
+    if source.startswith("temp_"):  # chunks ingested before the real filename was stored
+        source = source[len("temp_"):]
+    if "page" in metadata:
+        return f"{source}, page {int(metadata['page']) + 1}"  # PyPDF pages are 0-based
+    return source
+
+
+def format_snippet(doc, text):
+    return f"Snippet [{source_label(doc.metadata)}]: {text}"
+
+
+def compress_snippets(query, scored_docs, embedding, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Extractive compression of reranked chunks: every sentence is scored by cosine similarity to the
+    query (the shared embedding model), the best ones are kept until the token budget is spent, and
+    each chunk is rendered with only its kept sentences, in their original order, under its source.
+    """
+    raw = "\n\n".join(format_snippet(doc, doc.page_content) for doc, _ in scored_docs)
+    if not CONTEXT_COMPRESSION:
+        return raw
+
+    sentences = []  # (doc index, position in doc, text)
+    for i, (doc, _) in enumerate(scored_docs):
+        sentences.extend((i, j, s) for j, s in enumerate(split_sentences(doc.page_content)))
+    if not sentences:
+        return raw
+
+    query_vec = np.asarray(embedding.embed_query(query), dtype=np.float32)
+    vectors = np.asarray(embedding.embed_documents([s for _, _, s in sentences]), dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(query_vec) or 1.0)
+    similarity = vectors @ query_vec / np.where(norms == 0, 1.0, norms)
+
+    chosen, used = set(), 0
+    for k in np.argsort(-similarity):
+        if chosen and similarity[k] < SENTENCE_MIN_SIMILARITY:
+            break
+        cost = count_tokens(sentences[k][2])
+        if used + cost > budget:
+            if chosen:
+                continue
+            # the single best sentence is kept even when it alone exceeds the budget, cut to fit
+            sentences[k] = (*sentences[k][:2], sentences[k][2][:budget * 4])
+            cost = budget
+        chosen.add(int(k))
+        used += cost
+
+    snippets = []
+    for i, (doc, _) in enumerate(scored_docs):
+        kept = sorted((j, text) for k, (d, j, text) in enumerate(sentences) if d == i and k in chosen)
+        if not kept:
+            continue
+        parts, previous = [], None
+        for j, text in kept:
+            if previous is not None and j != previous + 1:
+                parts.append("...")
+            parts.append(text)
+            previous = j
+        snippets.append(format_snippet(doc, " ".join(parts)))
+    compressed = "\n\n".join(snippets)
+
+    context_tokens.inc(count_tokens(raw), stage="raw")
+    context_tokens.inc(count_tokens(compressed), stage="compressed")
+    print(f"DEBUG: Compressed knowledge base context {count_tokens(raw)} -> {count_tokens(compressed)} tokens")
+    return compressed
+
+
+def compression_stats():
+    raw = context_tokens.values.get(("raw",), 0)
+    compressed = context_tokens.values.get(("compressed",), 0)
+    prompt_tokens = llm_tokens.values.get(("in",), 0)
+    chats = sum(requests.values.values())
+    return {
+        "enabled": CONTEXT_COMPRESSION,
+        "token_budget": CONTEXT_TOKEN_BUDGET,
+        "context_tokens_raw": raw,
+        "context_tokens_compressed": compressed,
+        "reduction": round(1 - compressed / raw, 4) if raw else 0.0,
+        "avg_prompt_tokens_per_chat": round(prompt_tokens / chats, 1) if chats else 0.0,
+    }
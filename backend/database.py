@@ -4,12 +4,32 @@ import uuid
 from datetime import datetime
 import json
 import os
+import threading
+
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # how long a writer waits for the lock instead of failing
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))     # page cache per connection
+USERS_DB_PATH = os.getenv("USERS_DB_PATH", os.path.join(os.path.dirname(__file__), "data", "users.db"))
+
+class _ThreadConnection:
+    """The calling thread's long-lived connection; close() hands it back instead of closing it."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
 
 class UserDatabase:
-    def __init__(self, db_path=None):
+    def __init__(self, db_path=None, persistent=True):
+        self.persistent = persistent # False = a new connection per call (the old behaviour, kept for the benchmark)
+        self._local = threading.local()
         if db_path is None:
-            # This automatically finds the 'data/users.db' folder next to this file
-            self.db_path = os.path.join(os.path.dirname(__file__), "data", "users.db")
+            # 'data/users.db' next to this file unless USERS_DB_PATH says otherwise
+            self.db_path = USERS_DB_PATH
         else:
             self.db_path = db_path
             
@@ -17,9 +37,29 @@ class UserDatabase:
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
         self.init_database()
+
+    def connect(self):
+        """
+        This thread's connection, opened once with WAL (readers don't block on the writer and the
+        writer doesn't block readers), synchronous=NORMAL, a busy timeout and a bigger page cache.
+        """
+        if not self.persistent:
+            return sqlite3.connect(self.db_path)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL") # safe with WAL: a crash can lose the last commits, never corrupt
+            conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+            conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        elif conn.in_transaction:
+            conn.rollback() # left open by a call that failed half way
+        return _ThreadConnection(conn)
     
     def init_database(self):
-        conn=sqlite3.connect(self.db_path)
+        conn = self.connect()
         cursor=conn.cursor()
 
         cursor.execute('''
@@ -43,12 +83,29 @@ class UserDatabase:
             )
         ''')
 
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingestion_jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                message TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+
         conn.commit()
         conn.close()
 
     def create_user(self,username,password):
         try:
-            conn=sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor=conn.cursor()
 
             cursor.execute("SELECT id FROM users WHERE username= ?",(username,))
@@ -78,7 +135,7 @@ class UserDatabase:
     def verify_user(self, username, password):
         """..."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             # Find user by username
@@ -104,7 +161,7 @@ class UserDatabase:
         
     def get_user_by_id(self, user_id):
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute("SELECT username FROM users WHERE id = ?", (user_id,))
@@ -122,7 +179,7 @@ class UserDatabase:
         
     def create_conversation(self, user_id, title="New Chat"):
         try:
-            conn=sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor=conn.cursor()
 
             conv_id=str(uuid.uuid4())
@@ -145,7 +202,7 @@ class UserDatabase:
     def get_conversations(self, user_id):
         """Get all conversations for a user"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -172,7 +229,7 @@ class UserDatabase:
     def get_conversation(self, conv_id, user_id):
         """Get a specific conversation with messages"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -201,7 +258,7 @@ class UserDatabase:
     def add_message_to_conversation(self, conv_id, user_id, user_msg, bot_msg):
         """Add a message pair to a conversation"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             # Get current messages
@@ -244,7 +301,7 @@ class UserDatabase:
     def delete_conversation(self, conv_id, user_id):
         """Delete a conversation"""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.connect()
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM conversations WHERE id = ? AND user_id = ?', 
@@ -257,4 +314,116 @@ class UserDatabase:
         except Exception as e:
             print(f"❌ Error deleting conversation: {e}")
             return False
-            
\ No newline at end of file
+            
+    JOB_FIELDS = ("id", "user_id", "filename", "file_path", "status", "stage", "pages", "chunks", "message", "created_at", "updated_at")
+
+    def create_ingestion_job(self, user_id, filename, file_path, job_id=None):
+        """Record an accepted upload (status 'queued')"""
+        try:
+            job_id = job_id or str(uuid.uuid4())
+            now = datetime.now().isoformat()
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO ingestion_jobs (id, user_id, filename, file_path, status, stage, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, user_id, filename, file_path, "queued", "queued", now, now)
+            )
+            conn.commit()
+            conn.close()
+            return job_id
+        except Exception as e:
+            print(f"❌ Error creating ingestion job: {e}")
+            return None
+
+    def update_ingestion_job(self, job_id, **fields):
+        """Update status / stage / pages / chunks / message of a job"""
+        fields = {k: v for k, v in fields.items() if k in ("status", "stage", "pages", "chunks", "message")}
+        if not fields:
+            return True
+        try:
+            fields["updated_at"] = datetime.now().isoformat()
+            conn = self.connect()
+            cursor = conn.cursor()
+            assignments = ", ".join(f"{k} = ?" for k in fields)
+            cursor.execute(f'UPDATE ingestion_jobs SET {assignments} WHERE id = ?', (*fields.values(), job_id))
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            print(f"❌ Error updating ingestion job: {e}")
+            return False
+
+    def get_ingestion_job(self, job_id, user_id):
+        """Get one job as a dict, only if it belongs to the user"""
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute(f'SELECT {", ".join(self.JOB_FIELDS)} FROM ingestion_jobs WHERE id = ? AND user_id = ?', (job_id, user_id))
+            row = cursor.fetchone()
+            conn.close()
+            return dict(zip(self.JOB_FIELDS, row)) if row else None
+        except Exception as e:
+            print(f"❌ Error fetching ingestion job: {e}")
+            return None
+
+    def get_unfinished_ingestion_jobs(self):
+        """Jobs that were queued or running when the server stopped, oldest first"""
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(self.JOB_FIELDS)} FROM ingestion_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            )
+            rows = cursor.fetchall()
+            conn.close()
+            return [dict(zip(self.JOB_FIELDS, row)) for row in rows]
+        except Exception as e:
+            print(f"❌ Error fetching ingestion jobs: {e}")
+            return []
+
+db = UserDatabase() # one shared instance for every router
+
+
+if __name__ == "__main__":
+    # Concurrent readers (get_conversations) and writers (add_message_to_conversation):
+    #   python database.py [seconds] [readers] [writers]
+    # compares a connection per call in rollback-journal mode with per-thread WAL connections
+    import sys
+    import tempfile
+    import time
+
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    writers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    for label, persistent in (("per-call/journal", False), ("per-thread/WAL", True)):
+        bench_db = UserDatabase(os.path.join(tempfile.mkdtemp(), "bench.db"), persistent=persistent)
+        user_id = "bench-user"
+        conv_ids = [bench_db.create_conversation(user_id) for _ in range(50)]
+        latencies = {"read": [], "write": []}
+        failures = {"read": 0, "write": 0}
+        deadline = time.perf_counter() + seconds
+
+        def worker(kind, index):
+            i = 0
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                if kind == "read":
+                    ok = bench_db.get_conversations(user_id) is not None
+                else:
+                    ok = bench_db.add_message_to_conversation(conv_ids[(index + i * writers) % len(conv_ids)], user_id, "hello " * 20, "hi " * 50)
+                latencies[kind].append(time.perf_counter() - started)
+                failures[kind] += not ok
+                i += 1
+
+        threads = [threading.Thread(target=worker, args=("read", i)) for i in range(readers)]
+        threads += [threading.Thread(target=worker, args=("write", i)) for i in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        for kind in ("read", "write"):
+            lat = sorted(latencies[kind])
+            print(f"{label:17s} {kind:5s} {len(lat) / seconds:8.0f} ops/s  p50={lat[len(lat) // 2] * 1000:6.2f}ms  "
+                  f"p95={lat[int(len(lat) * 0.95)] * 1000:6.2f}ms  failed={failures[kind]}")
@@ -0,0 +1,117 @@
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_hash(text: str):
+    # whitespace-insensitive, so re-extracted text of an unchanged passage hashes the same
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()
+
+
+class DocumentRegistry:
+    """
+    What each user has ingested: one row per (user, filename) with the file hash, and one row per
+    chunk with its content hash and the id it has in the vector store and BM25 index. Lets ingestion
+    skip unchanged files, reuse unchanged chunks of an edited file and delete the ones that went away.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            self.db_path = os.path.join(os.path.dirname(__file__), "data", "document_registry.db")
+        else:
+            self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.init_database()
+
+    def init_database(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS documents (
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                chunks INTEGER NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (user_id, filename)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS document_chunks (
+                user_id TEXT NOT NULL,
+                filename TEXT NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (user_id, filename, chunk_hash)
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def get_file_hash(self, user_id: str, filename: str):
+        """Content hash of the stored version of this document, or None if it was never ingested."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            row = conn.execute(
+                'SELECT file_hash FROM documents WHERE user_id = ? AND filename = ?', (user_id, filename)
+            ).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def get_chunks(self, user_id: str, filename: str):
+        """chunk hash -> chunk id of what is currently stored for this document."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                'SELECT chunk_hash, chunk_id FROM document_chunks WHERE user_id = ? AND filename = ?', (user_id, filename)
+            ).fetchall()
+        finally:
+            conn.close()
+        return dict(rows)
+
+    def add_chunks(self, user_id: str, filename: str, pairs):
+        """Records (chunk hash, chunk id) pairs as soon as they are stored, so a retried upload reuses them."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                'INSERT OR REPLACE INTO document_chunks (user_id, filename, chunk_hash, chunk_id) VALUES (?, ?, ?, ?)',
+                [(user_id, filename, h, chunk_id) for h, chunk_id in pairs],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def remove_chunks(self, user_id: str, filename: str, hashes):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.executemany(
+                'DELETE FROM document_chunks WHERE user_id = ? AND filename = ? AND chunk_hash = ?',
+                [(user_id, filename, h) for h in hashes],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def set_document(self, user_id: str, filename: str, file_hash: str, chunks: int):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO documents (user_id, filename, file_hash, chunks, updated_at) VALUES (?, ?, ?, ?, ?)',
+                (user_id, filename, file_hash, chunks, datetime.now().isoformat()),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+
+document_registry = DocumentRegistry()
@@ -0,0 +1,95 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from telemetry import cache_lookups
+from batching import MicroBatcher, split_by_lengths
+from inference import load_embeddings_model
+
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "10000"))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+INGEST_EMBED_MAX_BATCH = int(os.getenv("INGEST_EMBED_MAX_BATCH", "256"))  # chunks per forward pass across concurrent uploads
+INGEST_EMBED_WAIT_MS = float(os.getenv("INGEST_EMBED_WAIT_MS", "50"))
+
+
+def normalize_query(text: str):
+    # MiniLM's tokenizer is uncased, so case and extra whitespace never change the vector
+    return " ".join(text.split()).lower()
+
+
+class EmbeddingService(Embeddings):
+    """
+    The one embedding model of the process, shared by the knowledge base, ingestion and Mem0.
+
+    Query embeddings are kept in an LRU cache keyed by normalized text, so the answer cache,
+    Mem0 search and search_knowledge_base embed the same question only once.
+    Document embeddings (ingestion) are not cached. Cache misses and other request-time embeddings
+    (context compression sentences, Mem0) from concurrent requests are micro-batched into one
+    forward pass; ingestion has its own, larger batches.
+    """
+
+    def __init__(self, model, max_entries=QUERY_EMBEDDING_CACHE_SIZE):
+        self.model = model
+        self.max_entries = max_entries
+        self.batcher = MicroBatcher("embed", self._embed_document_batches, max_batch_size=EMBED_MAX_BATCH, weight=len)
+        self.document_batcher = MicroBatcher(
+            "embed_docs", self._embed_document_batches,
+            max_batch_size=INGEST_EMBED_MAX_BATCH, max_wait_ms=INGEST_EMBED_WAIT_MS, weight=len,
+        )
+        self.cache = OrderedDict()  # normalized text -> float32 vector
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # probed once instead of read off the wrapped SentenceTransformer, which the wrapper keeps private
+        self.dimension = len(model.embed_query("dimension probe"))
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        return self.batcher.submit(texts) if texts else []
+
+    def _embed_document_batches(self, requests):
+        vectors = self.model.embed_documents([text for texts in requests for text in texts])
+        return split_by_lengths(vectors, [len(texts) for texts in requests])
+
+    def embed_documents_batched(self, texts):
+        """Ingestion path: chunk batches of files being ingested at the same time share one forward pass."""
+        return self.document_batcher.submit(list(texts))
+
+    def embed_query(self, text):
+        key = normalize_query(text)
+        with self.lock:
+            vector = self.cache.get(key)
+            if vector is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+        if vector is not None:
+            cache_lookups.inc(cache="query_embedding", result="hit")
+            return vector.tolist()
+
+        cache_lookups.inc(cache="query_embedding", result="miss")
+        vector = np.asarray(self.batcher.submit([text])[0], dtype=np.float32)
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = vector
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return vector.tolist()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            vector_bytes = sum(v.nbytes for v in self.cache.values())
+            key_bytes = sum(len(k) for k in self.cache)
+            return {
+                "model": EMBEDDING_MODEL_NAME,
+                "cached_queries": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "cache_bytes": vector_bytes + key_bytes,
+            }
+
+
+embedding_service = EmbeddingService(load_embeddings_model(EMBEDDING_MODEL_NAME))
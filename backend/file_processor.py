@@ -1,43 +1,273 @@
+import itertools
+import multiprocessing
 import os
 import shutil #used for high level file operations.
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from langchain_core.documents import Document
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, Docx2txtLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_qdrant import QdrantVectorStore
+from telemetry import span, ingest_chunks
+from document_registry import document_registry, file_sha256, chunk_hash
+from sparse_index import sparse_index
 
-def process_and_ingest_document(file_obj,filename,embedding_model,user_id,chunk_size=1000):
-    temp_filename=f"temp_{filename}"
+INGEST_BATCH_SIZE=int(os.getenv("INGEST_BATCH_SIZE","64")) #chunks embedded and upserted together; bounds memory per upload
+PARSE_WORKERS=int(os.getenv("PARSE_WORKERS",str(max(1,(os.cpu_count() or 2)-1)))) #parser processes, 0 = parse in the ingestion thread
+PARSE_PAGES_PER_TASK=int(os.getenv("PARSE_PAGES_PER_TASK","50")) #longer PDFs are parsed as page ranges in parallel
+PARSE_MAX_RANGES_IN_FLIGHT=int(os.getenv("PARSE_MAX_RANGES_IN_FLIGHT","4")) #per document, so pages held in memory do not grow with the core count
 
+def get_loader(path):
+    if path.endswith(".pdf"):
+        return PyPDFLoader(path)
+    elif path.endswith(".docx"):
+        return Docx2txtLoader(path)
+    return TextLoader(path)
+
+_parse_pool=None
+
+def start_parse_pool():
+    """
+    Forks the PARSE_WORKERS parser processes. Must run while the process is still single-threaded
+    (server.py calls it before importing the models): forking after torch, the batchers and the
+    worker threads are up can leave a child holding a lock that no thread will ever release.
+    Without fork (Windows) documents are parsed in the ingestion thread, since spawned children
+    would re-run server.py and load every model again.
+    """
+    global _parse_pool
+    if _parse_pool is not None or PARSE_WORKERS<=0 or "fork" not in multiprocessing.get_all_start_methods():
+        return _parse_pool
+    _parse_pool=ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("fork"))
+    # with fork the executor starts every worker on the first submit, so they all exist from here on
+    _parse_pool.submit(os.getpid).result()
+    print(f"DEBUG: Started {PARSE_WORKERS} parser processes")
+    return _parse_pool
+
+def parse_file(path):
+    """Runs in a parser process: every page of a document."""
+    return get_loader(path).load()
+
+def parse_pdf_pages(path,start,end):
+    """Runs in a parser process: pages [start, end) of a PDF, as PyPDFLoader would return them."""
+    from pypdf import PdfReader
+    reader=PdfReader(path)
+    return [Document(page_content=reader.pages[i].extract_text() or "", metadata={"source":path,"page":i}) for i in range(start,end)]
+
+_ingest_locks={} #key -> [lock, holders]
+_ingest_locks_guard=threading.Lock()
+
+@contextmanager
+def ingest_lock(*key):
+    """Serializes ingestion runs that share a key; entries are dropped once nobody holds or waits on them."""
+    with _ingest_locks_guard:
+        entry=_ingest_locks.setdefault(key,[threading.Lock(),0])
+        entry[1]+=1
     try:
-        with open(temp_filename,"wb") as buffer:
-            shutil.copyfileobj(file_obj,buffer)
-        print(f"DEBUG: processing file:{temp_filename} for User ID:{user_id}")
-
-        if temp_filename.endswith(".pdf"):
-            loader=PyPDFLoader(temp_filename)
-        elif temp_filename.endswith(".docx"):
-            loader=Docx2txtLoader(temp_filename)
-        else:
-            loader=TextLoader(temp_filename)
-        
-        docs=loader.load()
+        with entry[0]:
+            yield
+    finally:
+        with _ingest_locks_guard:
+            entry[1]-=1
+            if not entry[1]:
+                del _ingest_locks[key]
 
-        text_splitter=RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=200)
-        splits=text_splitter.split_documents(docs)
+def _pool_pages(pool,path):
+    if path.endswith(".pdf"):
+        from pypdf import PdfReader
+        total=len(PdfReader(path).pages)
+        if total>PARSE_PAGES_PER_TASK:
+            in_flight=deque()
+            for start in range(0,total,PARSE_PAGES_PER_TASK):
+                in_flight.append(pool.submit(parse_pdf_pages,path,start,min(start+PARSE_PAGES_PER_TASK,total)))
+                if len(in_flight)>=PARSE_MAX_RANGES_IN_FLIGHT:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+            return
+    yield from pool.submit(parse_file,path).result()
 
+def disable_parse_pool(pool,e):
+    """A dead parser process breaks the whole executor; parse in the ingestion threads from then on."""
+    global _parse_pool
+    if _parse_pool is pool:
+        _parse_pool=None
+        print(f"DEBUG: Parser process pool broke ({e}), parsing in the ingestion threads from now on")
+        pool.shutdown(wait=False,cancel_futures=True)
+
+def iter_pages(path):
+    """
+    Pages of a document in order. Once start_parse_pool has run, parsing happens in the parser processes
+    (off the GIL), long PDFs as page ranges in parallel with at most PARSE_MAX_RANGES_IN_FLIGHT ranges
+    (PARSE_PAGES_PER_TASK pages each) in flight.
+    """
+    pool=_parse_pool
+    done=0
+    if PARSE_WORKERS>0 and pool is not None:
+        try:
+            for page in _pool_pages(pool,path):
+                done+=1
+                yield page
+            return
+        except BrokenProcessPool as e:
+            disable_parse_pool(pool,e)
+    # pages already handed out (before the pool broke) are skipped, not parsed twice downstream
+    yield from itertools.islice(get_loader(path).lazy_load(),done,None)
+
+def _ingest(path,file_hash,filename,vector_service,user_id,chunk_size,report):
+    """The registry check and every write for one document; runs under that document's ingest lock."""
+    # only the same name counts: identical content under another name is its own document, which
+    # must survive edits or deletion of the first one, so it gets its own chunks
+    if document_registry.get_file_hash(user_id,filename)==file_hash:
+        ingest_chunks.inc(len(document_registry.get_chunks(user_id,filename)),result="reused")
+        report("indexing")
+        return True, f"{filename} is already in your knowledge base, nothing to re-learn"
+
+    text_splitter=RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=200)
+
+    existing=document_registry.get_chunks(user_id,filename) #chunk hash -> chunk id from an earlier version of this file
+    seen=set()
+    pages=0
+    chunks=0
+    embedded=0
+    batch=[]
+
+    def flush():
+        ids=[doc.metadata["chunk_id"] for doc in batch]
+        with span("ingest_embed_upsert"):
+            vector_service.add_documents(batch, ids=ids, batch_size=INGEST_BATCH_SIZE)
+        with span("ingest_sparse_index"):
+            sparse_index.add(user_id, batch, ids)
+        document_registry.add_chunks(user_id, filename, [(doc.metadata["chunk_hash"], doc.metadata["chunk_id"]) for doc in batch])
+        batch.clear()
+
+    report("parsing")
+    for page in iter_pages(path):
+        pages+=1
+        with span("ingest_split"):
+            splits=text_splitter.split_documents([page])
         for split in splits:
+            h=chunk_hash(split.page_content)
+            if h in seen:
+                continue #same passage twice in one file
+            seen.add(h)
+            chunks+=1
+            if h in existing:
+                continue #unchanged since the last upload, its vector is still stored
             split.metadata["user_id"]=user_id
+            split.metadata["source"]=filename #loaders record the temp path, keep the real name for attribution
+            split.metadata["chunk_id"]=str(uuid.uuid4()) #same id in Qdrant and the BM25 index, so hybrid results can be merged
+            split.metadata["chunk_hash"]=h
+            batch.append(split)
+            if len(batch)>=INGEST_BATCH_SIZE:
+                embedded+=len(batch)
+                flush()
+                report("embedding", pages=pages, chunks=chunks)
+    if batch:
+        embedded+=len(batch)
+        flush()
+    report("indexing", pages=pages, chunks=chunks)
+
+    if not chunks:
+        return False, f"No text could be extracted from {filename}"
+
+    removed={h: chunk_id for h, chunk_id in existing.items() if h not in seen}
+    if removed:
+        vector_service.delete(user_id, list(removed.values()))
+        sparse_index.delete(list(removed.values()))
+        document_registry.remove_chunks(user_id, filename, list(removed))
+    document_registry.set_document(user_id, filename, file_hash, chunks)
+
+    reused=chunks-embedded
+    ingest_chunks.inc(embedded,result="embedded")
+    ingest_chunks.inc(reused,result="reused")
+    ingest_chunks.inc(len(removed),result="deleted")
+    print(f"DEBUG: {filename}: {embedded} chunks embedded, {reused} reused, {len(removed)} deleted")
+    return True, f"Successfully learned from {filename}! ({pages} pages, {embedded} chunks embedded, {reused} reused, {len(removed)} removed)"
+
+def process_and_ingest_document(file_obj,filename,vector_service,user_id,chunk_size=1000,progress=None):
+    """
+    Streams a document into the knowledge base: pages are read lazily, split one at a time and the
+    chunks are embedded + upserted every INGEST_BATCH_SIZE chunks, so memory does not grow with the document.
+    """
+    report=progress or (lambda stage, **counts: None) #progress(stage, pages=..., chunks=...) for ingestion jobs
+    temp_path=None
+
+    try:
+        path=getattr(file_obj,"name",None)
+        if not (isinstance(path,str) and os.path.isfile(path)):
+            # unique name, so two uploads of the same file name never overwrite each other
+            fd,temp_path=tempfile.mkstemp(prefix="upload_",suffix=os.path.splitext(filename)[1])
+            with os.fdopen(fd,"wb") as buffer:
+                shutil.copyfileobj(file_obj,buffer)
+            path=temp_path
+        print(f"DEBUG: processing file:{filename} for User ID:{user_id}")
+
+        file_hash=file_sha256(path)
+        # the same document must not be ingested twice at once: both runs would see an empty registry
+        # and embed everything, orphaning one set of vectors
+        with ingest_lock(user_id,filename):
+            return _ingest(path,file_hash,filename,vector_service,user_id,chunk_size,report)
 
-        QdrantVectorStore.from_documents(
-            splits,
-            embedding_model,
-            url="http://localhost:6333",
-            collection_name="learning-rag"
-        )
-        return True, f"Successfully learned from {filename}!"
-        
     except Exception as e:
         return False, str(e)
-        
+
     finally:
-        if os.path.exists(temp_filename):
-            os.remove(temp_filename)
\ No newline at end of file
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+if __name__ == "__main__":
+    # Ingestion throughput, written to a throwaway local vector index, BM25 and registry database:
+    #   python file_processor.py big.pdf            -> one document: chunks/s and peak RSS
+    #   python file_processor.py a.pdf b.pdf ...    -> documents/minute, one-at-a-time vs. parallel (bulk path)
+    import resource
+    from concurrent.futures import ThreadPoolExecutor
+    start_parse_pool() #before the embedding model loads, like server.py
+    from embeddings import embedding_service
+    from local_index import LocalVectorBackend
+    from sparse_index import SparseIndex
+    from document_registry import DocumentRegistry
+    from vector_store import VectorStoreService
+
+    if len(sys.argv) < 2:
+        sys.exit("usage: python file_processor.py <document> [more documents...]")
+    paths=sys.argv[1:]
+
+    def run(parallel):
+        global sparse_index, document_registry, PARSE_WORKERS
+        scratch=tempfile.mkdtemp()
+        sparse_index=SparseIndex(os.path.join(scratch,"sparse.db"))
+        document_registry=DocumentRegistry(os.path.join(scratch,"registry.db"))
+        service=VectorStoreService(embedding_service, backend="local")
+        service.backend=LocalVectorBackend(embedding_service.dimension, root=scratch)
+        PARSE_WORKERS=int(os.getenv("PARSE_WORKERS",str(max(1,(os.cpu_count() or 2)-1)))) if parallel else 0
+        counts={}
+
+        def ingest(path):
+            with open(path,"rb") as f:
+                return process_and_ingest_document(f, os.path.basename(path), service, "bench-user",
+                                                   progress=lambda stage, **c: counts.setdefault(path,{}).update(c))
+
+        started=time.perf_counter()
+        if parallel:
+            with ThreadPoolExecutor(max_workers=int(os.getenv("INGEST_WORKERS","4"))) as pool:
+                results=list(pool.map(ingest,paths))
+        else:
+            results=[ingest(path) for path in paths]
+        elapsed=time.perf_counter()-started
+        shutil.rmtree(scratch,ignore_errors=True)
+        chunks=sum(c.get("chunks",0) for c in counts.values())
+        failed=[message for ok,message in results if not ok]
+        return elapsed,chunks,failed
+
+    for label,parallel in (("one-at-a-time",False),("parallel",True)) if len(paths)>1 else (("streaming",True),):
+        elapsed,chunks,failed=run(parallel)
+        peak_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+        print(f"{label:14s} docs={len(paths)} chunks={chunks} time={elapsed:.1f}s docs/min={len(paths)/elapsed*60:.1f} "
+              f"chunks/s={chunks/elapsed:.1f} peak_rss={peak_mb:.0f}MB" + (f" failed={failed}" if failed else ""))
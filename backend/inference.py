@@ -0,0 +1,143 @@
+import os
+import sys
+import time
+from langchain_huggingface import HuggingFaceEmbeddings
+from sentence_transformers import CrossEncoder
+
+# torch      : default PyTorch models
+# onnx       : same weights exported to ONNX Runtime
+# onnx-int8  : ONNX Runtime with dynamically quantized int8 weights (fastest on CPU)
+# the onnx backends need the extra packages in requirements-onnx.txt
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+# which int8 kernel set to use: avx2 (any modern x86), avx512, avx512_vnni or arm64
+ONNX_QUANT_CONFIG = os.getenv("ONNX_QUANT_CONFIG", "avx2").lower()
+
+RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+
+
+def onnx_file_name(backend=INFERENCE_BACKEND, quant_config=ONNX_QUANT_CONFIG):
+    """ONNX file inside the model repo; the sentence-transformers models ship these pre-exported."""
+    if backend == "onnx":
+        return "onnx/model.onnx"
+    prefix = "quint8" if quant_config == "avx2" else "qint8"
+    return f"onnx/model_{prefix}_{quant_config}.onnx"
+
+
+def backend_kwargs(backend=INFERENCE_BACKEND):
+    """Keyword arguments for SentenceTransformer / CrossEncoder that select the inference backend."""
+    if backend == "torch":
+        return {}
+    if backend not in ("onnx", "onnx-int8"):
+        raise ValueError(f"Unknown INFERENCE_BACKEND '{backend}' (use torch, onnx or onnx-int8)")
+    return {"backend": "onnx", "model_kwargs": {"file_name": onnx_file_name(backend)}}
+
+
+def backend_error(kind, model_name, backend, e):
+    # an explicitly configured ONNX backend that cannot load is a deployment error, not a reason to
+    # quietly serve the slower PyTorch model
+    return RuntimeError(
+        f"Could not load the {kind} {model_name} with INFERENCE_BACKEND={backend}: {e}. "
+        f"Install the ONNX extras (pip install -r requirements-onnx.txt) or set INFERENCE_BACKEND=torch."
+    )
+
+
+def load_embeddings_model(model_name, backend=INFERENCE_BACKEND):
+    try:
+        model = HuggingFaceEmbeddings(model_name=model_name, model_kwargs=backend_kwargs(backend))
+    except Exception as e:
+        if backend == "torch":
+            raise
+        raise backend_error("embedder", model_name, backend, e) from e
+    print(f"DEBUG: Loaded embedder {model_name} ({backend})")
+    return model
+
+
+def load_reranker(model_name=RERANKER_MODEL_NAME, backend=INFERENCE_BACKEND):
+    try:
+        model = CrossEncoder(model_name, **backend_kwargs(backend))
+    except Exception as e:
+        if backend == "torch":
+            raise
+        raise backend_error("reranker", model_name, backend, e) from e
+    print(f"DEBUG: Loaded reranker {model_name} ({backend})")
+    return model
+
+
+# Fixed query set for comparing backends; each query has relevant and distracting passages.
+CHECK_SET = [
+    ("what programming languages does the candidate know", [
+        "Skills: Python, Java, C++ and SQL. Familiar with Go and Rust.",
+        "The candidate enjoys hiking and photography in their free time.",
+        "Worked as a backend engineer building REST APIs in Python and FastAPI.",
+        "Education: B.Tech in Computer Science, graduated 2022.",
+        "Languages spoken: English, Hindi.",
+    ]),
+    ("how do I reset my password", [
+        "To reset your password, click 'Forgot password' on the login page and follow the email link.",
+        "Passwords must be at least 6 characters long.",
+        "Our office is open Monday to Friday, 9am to 5pm.",
+        "Two-factor authentication can be enabled in account settings.",
+        "Contact support if you do not receive the reset email within 10 minutes.",
+    ]),
+    ("what was the revenue growth in 2023", [
+        "Revenue grew 18% year over year in 2023, reaching $42 million.",
+        "The company was founded in 2011 in Bangalore.",
+        "Operating costs rose 9% in 2023 due to hiring.",
+        "In 2022 revenue was $35.6 million.",
+        "The board approved a new dividend policy.",
+    ]),
+    ("error code E1042 meaning", [
+        "E1042: the device could not reach the update server. Check the network connection.",
+        "E1043: firmware signature invalid.",
+        "Restart the device by holding the power button for 10 seconds.",
+        "All error codes starting with E1 relate to connectivity.",
+        "The warranty covers manufacturing defects for two years.",
+    ]),
+]
+
+
+def check_reranker_accuracy(backend=INFERENCE_BACKEND, repeats=20):
+    """
+    Compares a backend against the PyTorch reranker on CHECK_SET: Spearman correlation of the scores,
+    whether the top-1 and top-3 agree, and the rerank speedup.
+    """
+    from scipy.stats import spearmanr
+
+    reference = CrossEncoder(RERANKER_MODEL_NAME)
+    candidate = load_reranker(backend=backend)
+
+    correlations, top1_agree, top3_overlap = [], 0, []
+    ref_time = cand_time = 0.0
+    for query, docs in CHECK_SET:
+        pairs = [[query, d] for d in docs]
+        started = time.perf_counter()
+        for _ in range(repeats):
+            ref_scores = reference.predict(pairs)
+        ref_time += time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(repeats):
+            cand_scores = candidate.predict(pairs)
+        cand_time += time.perf_counter() - started
+
+        correlations.append(spearmanr(ref_scores, cand_scores).correlation)
+        ref_order = sorted(range(len(docs)), key=lambda i: ref_scores[i], reverse=True)
+        cand_order = sorted(range(len(docs)), key=lambda i: cand_scores[i], reverse=True)
+        top1_agree += ref_order[0] == cand_order[0]
+        top3_overlap.append(len(set(ref_order[:3]) & set(cand_order[:3])) / 3)
+
+    return {
+        "backend": backend,
+        "mean_spearman": round(sum(correlations) / len(correlations), 4),
+        "min_spearman": round(min(correlations), 4),
+        "top1_agreement": round(top1_agree / len(CHECK_SET), 4),
+        "top3_overlap": round(sum(top3_overlap) / len(top3_overlap), 4),
+        "speedup": round(ref_time / cand_time, 2) if cand_time else None,
+    }
+
+
+if __name__ == "__main__":
+    # python inference.py [onnx|onnx-int8]   -> accuracy/speed of that backend vs. PyTorch
+    backend = sys.argv[1] if len(sys.argv) > 1 else INFERENCE_BACKEND
+    if backend == "torch":
+        backend = "onnx-int8"
+    print(check_reranker_accuracy(backend))
@@ -0,0 +1,210 @@
+import os
+import posixpath
+import shutil
+import threading
+import uuid
+import zipfile
+from collections import OrderedDict, deque
+from database import db
+from file_processor import process_and_ingest_document
+from answer_cache import answer_cache
+from tools import mark_user_has_documents, vector_service
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))  # documents processed at the same time (parsing runs in PARSE_WORKERS processes)
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.path.dirname(__file__), "data", "uploads"))
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", "200"))
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(500 * 1024 * 1024)))  # uncompressed size of one zip
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md")
+
+
+def unique_name(name, taken):
+    """name, or "name (2).ext", "name (3).ext"... so one request never submits two documents under one name."""
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate in taken:
+        n += 1
+        candidate = f"{stem} ({n}){ext}"
+    taken.add(candidate)
+    return candidate
+
+
+def archive_name(member_name):
+    """Path of a zip member as the document's name ("2023/report.pdf"), without "..", "." or leading slashes."""
+    parts = [p for p in posixpath.normpath(member_name.replace("\\", "/")).split("/") if p not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+class IngestionQueue:
+    """
+    Background document ingestion.
+
+    An upload is spooled to UPLOAD_DIR and recorded in the ingestion_jobs table, then picked up by
+    one of INGEST_WORKERS threads. Users are served round-robin, so one user uploading fifty files
+    does not hold up everyone else's single upload. Progress (stage, pages, chunks) is written to the
+    job row as the pipeline runs. Jobs still queued or running when the server stopped are picked
+    up again on the next start, as long as their spooled file is still there.
+    """
+
+    def __init__(self, workers=INGEST_WORKERS, upload_dir=UPLOAD_DIR):
+        self.workers = workers
+        self.upload_dir = upload_dir
+        self.pending = OrderedDict()  # user_id -> deque of jobs, users in round-robin order
+        self.cond = threading.Condition()
+        self.threads = []
+        self.stopping = False
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        if self.threads:
+            return
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self.stopping = False
+        self.recover()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        """Stops taking new jobs; unfinished ones stay in the table and resume on the next start."""
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.threads = []
+
+    def recover(self):
+        for job in db.get_unfinished_ingestion_jobs():
+            if os.path.exists(job["file_path"]):
+                print(f"DEBUG: Resuming ingestion job {job['id']} ({job['filename']})")
+                db.update_ingestion_job(job["id"], status="queued", stage="queued")
+                self._enqueue(job)
+            else:
+                db.update_ingestion_job(job["id"], status="failed", stage="failed", message="Upload was lost in a server restart, please upload again")
+
+    def submit(self, user_id, filename, file_obj):
+        """Spools the upload to disk, records the job and queues it. Returns the job id."""
+        job_id = str(uuid.uuid4())
+        # filename can be a path inside a zip; the spooled copy only needs the extension for its loader
+        file_path = os.path.join(self.upload_dir, f"{job_id}{os.path.splitext(filename)[1]}")
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file_obj, buffer)
+        if not db.create_ingestion_job(user_id, filename, file_path, job_id=job_id):
+            os.remove(file_path)
+            raise RuntimeError(f"Could not record the upload of {filename}")
+        self._enqueue({"id": job_id, "user_id": user_id, "filename": filename, "file_path": file_path})
+        return job_id
+
+    def submit_many(self, user_id, uploads):
+        """
+        Bulk upload: (filename, file object) pairs, where a .zip is expanded into the documents it
+        contains. Every document becomes its own job, so the workers ingest them in parallel.
+        Zip members keep their path inside the archive as their name, and names repeated within the
+        request get a " (2)" suffix: the registry treats a known name as a new version of that document.
+        Returns ([(job_id, filename)], [skipped filenames]).
+        """
+        jobs, skipped, taken = [], [], set()
+        for filename, file_obj in uploads:
+            if filename.lower().endswith(".zip"):
+                with zipfile.ZipFile(file_obj) as archive:
+                    members = [m for m in archive.infolist() if not m.is_dir()]
+                    if sum(m.file_size for m in members) > BULK_MAX_BYTES:
+                        raise ValueError(f"{filename} is larger than {BULK_MAX_BYTES // (1024 * 1024)} MB uncompressed")
+                    for member in members:
+                        name = archive_name(member.filename)
+                        if not name.lower().endswith(SUPPORTED_EXTENSIONS) or len(jobs) >= BULK_MAX_FILES:
+                            skipped.append(name)
+                            continue
+                        name = unique_name(name, taken)
+                        with archive.open(member) as member_obj:
+                            jobs.append((self.submit(user_id, name, member_obj), name))
+            elif len(jobs) < BULK_MAX_FILES:
+                name = unique_name(os.path.basename(filename), taken)
+                jobs.append((self.submit(user_id, name, file_obj), name))
+            else:
+                skipped.append(filename)
+        return jobs, skipped
+
+    def _enqueue(self, job):
+        with self.cond:
+            self.pending.setdefault(job["user_id"], deque()).append(job)
+            self.cond.notify()
+
+    def _next_job(self):
+        with self.cond:
+            while not self.pending and not self.stopping:
+                self.cond.wait()
+            if self.stopping:
+                return None
+            user_id, jobs = self.pending.popitem(last=False)
+            job = jobs.popleft()
+            if jobs:
+                self.pending[user_id] = jobs  # back of the line
+            self.running += 1
+            return job
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._run(job)
+            except Exception as e:
+                # e.g. "database is locked" while recording the outcome; the worker must keep going
+                print(f"DEBUG: Ingestion job {job['id']} crashed: {e}")
+                self.failed += 1
+                try:
+                    db.update_ingestion_job(job["id"], status="failed", stage="failed", message=str(e))
+                except Exception as db_error:
+                    print(f"DEBUG: Could not mark ingestion job {job['id']} as failed: {db_error}")
+            finally:
+                with self.cond:
+                    self.running -= 1
+
+    def _run(self, job):
+        job_id, user_id = job["id"], job["user_id"]
+        db.update_ingestion_job(job_id, status="running", stage="starting")
+
+        def progress(stage, **counts):
+            db.update_ingestion_job(job_id, stage=stage, **counts)
+
+        try:
+            with open(job["file_path"], "rb") as file_obj:
+                success, message = process_and_ingest_document(
+                    file_obj=file_obj,
+                    filename=job["filename"],
+                    vector_service=vector_service,
+                    user_id=user_id,
+                    progress=progress,
+                )
+        except Exception as e:
+            success, message = False, str(e)
+
+        if success:
+            # answers given before this upload may now be incomplete
+            answer_cache.invalidate_user(user_id)
+            mark_user_has_documents(user_id)
+            db.update_ingestion_job(job_id, status="done", stage="done", message=message)
+            self.completed += 1
+        else:
+            print(f"DEBUG: Ingestion job {job_id} failed: {message}")
+            db.update_ingestion_job(job_id, status="failed", stage="failed", message=message)
+            self.failed += 1
+        if os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+    def stats(self):
+        with self.cond:
+            return {
+                "workers": self.workers,
+                "queued": sum(len(jobs) for jobs in self.pending.values()),
+                "users_waiting": len(self.pending),
+                "running": self.running,
+                "completed": self.completed,
+                "failed": self.failed,
+            }
+
+
+ingestion_queue = IngestionQueue()
@@ -0,0 +1,127 @@
+import json
+import os
+import numpy as np
+from concurrency import run_in_model_executor
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() == "true"
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", "0.7"))  # best prototype must be at least this close
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", "0.1"))          # ...and this much closer than any other intent
+INTENT_PROTOTYPES_FILE = os.getenv("INTENT_PROTOTYPES_FILE")              # optional JSON {"intent": ["example", ...]}
+
+TIME = "time"
+DOCUMENTS = "documents"
+SMALLTALK = "smalltalk"
+
+DEFAULT_PROTOTYPES = {
+    TIME: [
+        "what time is it",
+        "what is the current time",
+        "what's the date today",
+        "what day is it today",
+        "tell me the current date and time",
+    ],
+    DOCUMENTS: [
+        "what does my document say about this",
+        "summarize the file I uploaded",
+        "what is written in my pdf",
+        "according to my resume what are my skills",
+        "find this in my uploaded notes",
+        "what does the report I uploaded conclude",
+    ],
+    SMALLTALK: [
+        "hi",
+        "hello there",
+        "how are you",
+        "thanks a lot",
+        "good morning",
+        "who are you",
+        "bye, see you later",
+    ],
+}
+
+
+class IntentRouter:
+    """
+    Classifies a message against example phrases ("prototypes") with the MiniLM embeddings that are
+    already loaded. Confident matches skip the tool-selection LLM call; anything uncertain returns
+    None and the agent decides as usual.
+    """
+
+    def __init__(self, embedding_model, prototypes=None, min_similarity=INTENT_MIN_SIMILARITY, min_margin=INTENT_MIN_MARGIN):
+        self.embedding_model = embedding_model
+        self.prototypes = prototypes or self._load_prototypes()
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        self.labels = []
+        self.matrix = None
+
+        self.total = 0
+        self.routed = {TIME: 0, DOCUMENTS: 0, SMALLTALK: 0}
+        self.llm_calls_saved = 0
+
+    @staticmethod
+    def _load_prototypes():
+        if INTENT_PROTOTYPES_FILE:
+            with open(INTENT_PROTOTYPES_FILE) as f:
+                return json.load(f)
+        return DEFAULT_PROTOTYPES
+
+    def _ensure_prototypes(self):
+        if self.matrix is not None:
+            return
+        labels, texts = [], []
+        for intent, examples in self.prototypes.items():
+            labels.extend([intent] * len(examples))
+            texts.extend(examples)
+        vectors = np.asarray(self.embedding_model.embed_documents(texts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.labels, self.matrix = labels, vectors
+
+    def classify(self, embedding):
+        """Returns (intent, similarity) if one intent clearly wins, otherwise (None, similarity)."""
+        self._ensure_prototypes()
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        sims = self.matrix @ query
+
+        best_per_intent = {}
+        for label, sim in zip(self.labels, sims):
+            best_per_intent[label] = max(best_per_intent.get(label, -1.0), float(sim))
+        ranked = sorted(best_per_intent.items(), key=lambda x: x[1], reverse=True)
+        intent, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else -1.0
+        if best >= self.min_similarity and best - runner_up >= self.min_margin:
+            return intent, best
+        return None, best
+
+    async def route(self, query: str, user_id: str, has_documents, embedding=None):
+        """
+        Decides the route for one message. `has_documents` is an async callable, only awaited
+        when the message looks like a document question.
+        """
+        self.total += 1
+        if embedding is None:
+            embedding = await run_in_model_executor(self.embedding_model.embed_query, query)
+        intent, similarity = await run_in_model_executor(self.classify, embedding)
+
+        if intent == DOCUMENTS and not await has_documents(user_id):
+            intent = None  # nothing uploaded, let the agent answer from its own knowledge
+        if intent is None:
+            return None
+
+        self.routed[intent] += 1
+        if intent in (TIME, DOCUMENTS):
+            self.llm_calls_saved += 1  # the tool call is made locally instead of by the LLM
+        print(f"DEBUG: Routed locally as '{intent}' (similarity {similarity:.2f})")
+        return intent
+
+    def stats(self):
+        local = sum(self.routed.values())
+        return {
+            "enabled": INTENT_ROUTER_ENABLED,
+            "requests": self.total,
+            "routed_locally": local,
+            "routed_locally_pct": round(100 * local / self.total, 2) if self.total else 0.0,
+            "by_intent": dict(self.routed),
+            "llm_calls_saved": self.llm_calls_saved,
+        }
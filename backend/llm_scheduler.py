@@ -0,0 +1,228 @@
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+
+# Groq free tier limits for llama-3.3-70b-versatile; raise them for paid plans.
+GROQ_RPM = int(os.getenv("GROQ_RPM", "30"))
+GROQ_TPM = int(os.getenv("GROQ_TPM", "12000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "60"))  # longest a request may wait for a slot
+LLM_OUTPUT_TOKEN_ESTIMATE = 512
+
+INTERACTIVE = 0  # user is waiting on the answer
+BACKGROUND = 1   # Mem0 extraction, can wait
+
+
+class LLMQueueTimeout(Exception):
+    pass
+
+
+def is_rate_limit_error(e: Exception):
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status in (413, 429):
+        return True
+    text = str(e).lower()
+    return "rate_limit" in text or "rate limit" in text or "413" in text
+
+
+def retry_after_seconds(e: Exception):
+    """Reads the Retry-After header from a Groq/httpx error, if there is one."""
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_tokens(messages):
+    """Rough prompt size (4 chars per token) plus room for the answer."""
+    chars = sum(len(str(getattr(m, "content", m))) for m in messages)
+    return chars // 4 + LLM_OUTPUT_TOKEN_ESTIMATE
+
+
+class LLMScheduler:
+    """
+    Admission control for Groq calls.
+
+    Requests wait until the rolling one-minute request and token budgets have room. Interactive
+    requests are always admitted before background ones, and within a priority users are served
+    round-robin so one heavy user cannot starve the rest. Rate-limit errors are retried with
+    jittered exponential backoff, and a Retry-After from Groq pauses all dispatching until it passes.
+    """
+
+    def __init__(self, rpm=GROQ_RPM, tpm=GROQ_TPM, max_concurrency=LLM_MAX_CONCURRENCY,
+                 max_retries=LLM_MAX_RETRIES, queue_timeout=LLM_QUEUE_TIMEOUT, base_delay=1.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.queue_timeout = queue_timeout
+        self.base_delay = base_delay
+
+        self.waiting = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}  # user_id -> deque of (future, tokens, requests)
+        self.window = deque()  # [timestamp, tokens, requests] for every admitted call in the last minute
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.timer = None
+
+        self.admitted = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+
+    # ---- budget bookkeeping ----
+
+    def _trim_window(self, now):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window.popleft()
+
+    def _delay_for(self, tokens, requests, now):
+        """Seconds until a call of this size fits the budgets (0 if it fits now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._trim_window(now)
+        delay = 0.0
+        for index, size, budget in ((2, requests, self.rpm), (1, tokens, self.tpm)):
+            used = sum(entry[index] for entry in self.window)
+            if self.window and used + size > budget:
+                # wait until enough old entries have rolled out of the window
+                freed = 0
+                for entry in self.window:
+                    freed += entry[index]
+                    if used - freed + size <= budget:
+                        delay = max(delay, 60 - (now - entry[0]))
+                        break
+        return delay
+
+    # ---- queueing ----
+
+    def _next_waiter(self):
+        for priority in (INTERACTIVE, BACKGROUND):
+            users = self.waiting[priority]
+            if users:
+                return priority, next(iter(users))
+        return None, None
+
+    def _schedule(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        while self.in_flight < self.max_concurrency:
+            priority, user_id = self._next_waiter()
+            if user_id is None:
+                return
+            users = self.waiting[priority]
+            future, tokens, requests = users[user_id][0]
+            now = time.monotonic()
+            delay = self._delay_for(tokens, requests, now)
+            if delay > 0:
+                self.timer = asyncio.get_running_loop().call_later(delay, self._schedule)
+                return
+
+            users[user_id].popleft()
+            if users[user_id]:
+                users.move_to_end(user_id)  # round-robin between users
+            else:
+                del users[user_id]
+            if future.done():  # caller gave up while waiting
+                continue
+            entry = [now, tokens, requests]
+            self.window.append(entry)
+            self.in_flight += 1
+            self.admitted += 1
+            future.set_result(entry)
+
+    def _forget(self, priority, user_id, future):
+        queue = self.waiting[priority].get(user_id)
+        if queue is None:
+            return
+        for item in list(queue):
+            if item[0] is future:
+                queue.remove(item)
+        if not queue:
+            del self.waiting[priority][user_id]
+
+    async def _acquire(self, user_id, priority, tokens, requests):
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[priority].setdefault(user_id, deque()).append((future, tokens, requests))
+        self._schedule()
+        started = time.monotonic()
+        try:
+            entry = await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._forget(priority, user_id, future)
+            if future.done() and not future.cancelled():
+                self._release()  # admitted at the last moment, give the slot back
+            else:
+                future.cancel()
+            self.timeouts += 1
+            raise LLMQueueTimeout("rate_limit: waited too long for an LLM slot")
+        except asyncio.CancelledError:
+            self._forget(priority, user_id, future)
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                future.cancel()
+            raise
+        self.total_wait += time.monotonic() - started
+        return entry
+
+    def _release(self):
+        self.in_flight -= 1
+        self._schedule()
+
+    # ---- public API ----
+
+    async def run(self, call, user_id="anonymous", priority=INTERACTIVE, tokens=LLM_OUTPUT_TOKEN_ESTIMATE, requests=1):
+        """
+        Runs `call` (a function returning an awaitable) once the budgets allow it.
+        `requests` is how many Groq requests one call makes (Mem0's add makes several).
+        Rate-limit errors are retried; anything else is raised straight away.
+        """
+        for attempt in range(self.max_retries + 1):
+            entry = await self._acquire(user_id, priority, tokens, requests)
+            try:
+                result = await call()
+                usage = getattr(result, "usage_metadata", None)
+                if usage and usage.get("total_tokens"):
+                    entry[1] = usage["total_tokens"]  # replace the estimate with what was really used
+                return result
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self.rate_limited += 1
+                self.retries += 1
+                retry_after = retry_after_seconds(e)
+                delay = self.base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                    # the quota is shared, so nobody should call Groq before it resets
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+                print(f"DEBUG: Groq rate limit hit, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            finally:
+                self._release()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        now = time.monotonic()
+        self._trim_window(now)
+        return {
+            "in_flight": self.in_flight,
+            "waiting_interactive": sum(len(q) for q in self.waiting[INTERACTIVE].values()),
+            "waiting_background": sum(len(q) for q in self.waiting[BACKGROUND].values()),
+            "requests_last_minute": sum(entry[2] for entry in self.window),
+            "tokens_last_minute": sum(entry[1] for entry in self.window),
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "retries": self.retries,
+            "queue_timeouts": self.timeouts,
+            "avg_wait_seconds": round(self.total_wait / self.admitted, 3) if self.admitted else 0.0,
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,291 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import numpy as np
+from langchain_core.documents import Document
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(os.path.dirname(__file__), "data", "vectors"))
+LOCAL_VECTOR_DTYPE = os.getenv("LOCAL_VECTOR_DTYPE", "float32")  # float16 halves disk and page cache
+ANN_THRESHOLD = int(os.getenv("LOCAL_ANN_THRESHOLD", "50000"))   # tenants above this many chunks get an IVF index
+IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+SEARCH_BLOCK_ROWS = 65536  # brute force scans in blocks so float16 upcasting never materializes the whole matrix
+
+
+def _kmeans(data, n_clusters, iterations=10, seed=0):
+    """Plain spherical k-means on unit vectors; good enough for an IVF coarse quantizer."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(n_clusters):
+            members = data[assign == c]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+    return centroids
+
+
+class TenantIndex:
+    """
+    One user's vectors and payloads on disk:
+
+      vectors.bin   unit-normalized rows (float32/float16), appended, read through np.memmap
+      ids.txt       chunk id per row
+      payload.jsonl {"page_content", "metadata"} per row; only the top-k rows are ever read back
+      deleted.txt   row numbers removed since they were written (tombstones)
+      ivf.npz       coarse centroids + row lists, built once the tenant passes ANN_THRESHOLD
+    """
+
+    def __init__(self, path, dim, dtype):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _line_offsets(self, name):
+        """Start offsets of the complete lines of a file, plus the end of the last one. A torn last line
+        (crash mid-append) is cut off so appends continue cleanly. Streams, so payloads are never all in memory."""
+        offsets = [0]
+        if os.path.exists(self._file(name)):
+            with open(self._file(name), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        print(f"DEBUG: {self.path}: dropping a partially written line of {name}")
+                        os.truncate(self._file(name), offsets[-1])
+                        break
+                    offsets.append(offsets[-1] + len(line))
+        return offsets
+
+    def _load(self):
+        ids = []
+        if self._line_offsets("ids.txt")[-1]:  # also cuts a torn last id
+            with open(self._file("ids.txt")) as f:
+                ids = [line.rstrip("\n") for line in f]
+        payload_offsets = self._line_offsets("payload.jsonl")
+        row_bytes = self.dim * self.dtype.itemsize
+        vector_rows = os.path.getsize(self._file("vectors.bin")) // row_bytes if os.path.exists(self._file("vectors.bin")) else 0
+
+        # a row is appended to vectors.bin, payload.jsonl and ids.txt in turn; after a crash in between,
+        # cut all three back to the rows they all hold so later appends stay aligned
+        rows = min(len(ids), len(payload_offsets) - 1, vector_rows)
+        if (len(ids), len(payload_offsets) - 1, vector_rows) != (rows, rows, rows):
+            print(f"DEBUG: {self.path}: truncating to {rows} rows after an interrupted write")
+            ids = ids[:rows]
+            os.truncate(self._file("ids.txt"), sum(len(i.encode()) + 1 for i in ids))
+            os.truncate(self._file("payload.jsonl"), payload_offsets[rows])
+            if os.path.exists(self._file("vectors.bin")):
+                os.truncate(self._file("vectors.bin"), rows * row_bytes)
+
+        self.ids = ids
+        self.row_of = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self.offsets = payload_offsets[:rows]
+
+        # rows, not ids: a re-added id has a newer row that must stay live
+        self.deleted = set()
+        deleted_end = self._line_offsets("deleted.txt")[-1]
+        if deleted_end:
+            with open(self._file("deleted.txt")) as f:
+                self.deleted = {int(line) for line in f if line.strip() and int(line) < rows}
+
+        self.ivf = None
+        if os.path.exists(self._file("ivf.npz")):
+            data = np.load(self._file("ivf.npz"))
+            if int(data["size"]) <= rows:  # built over rows that were cut off: rebuilt on a later add
+                self.ivf = {"centroids": data["centroids"], "assign": data["assign"], "size": int(data["size"])}
+        self._map()
+
+    def _map(self):
+        n = len(self.ids)
+        self.vectors = np.memmap(self._file("vectors.bin"), dtype=self.dtype, mode="r", shape=(n, self.dim)) if n else None
+
+    @property
+    def live_count(self):
+        return len(self.ids) - len(self.deleted)
+
+    def add(self, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+        with self.lock:
+            replaced = [i for i in ids if i in self.row_of]
+            if replaced:
+                self._tombstone(replaced)
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(vectors.astype(self.dtype).tobytes())
+            with open(self._file("payload.jsonl"), "ab") as f:
+                offset = f.tell()
+                for payload in payloads:
+                    line = (json.dumps(payload, default=str) + "\n").encode()
+                    self.offsets.append(offset)
+                    f.write(line)
+                    offset += len(line)
+            with open(self._file("ids.txt"), "a") as f:
+                for chunk_id in ids:
+                    self.row_of[chunk_id] = len(self.ids)
+                    self.ids.append(chunk_id)
+                    f.write(chunk_id + "\n")
+            self._map()
+            if self.live_count >= ANN_THRESHOLD and (self.ivf is None or len(self.ids) >= 2 * self.ivf["size"]):
+                self._build_ivf()
+
+    def _tombstone(self, ids):
+        with open(self._file("deleted.txt"), "a") as f:
+            for chunk_id in ids:
+                row = self.row_of.get(chunk_id)
+                if row is not None and row not in self.deleted:
+                    self.deleted.add(row)
+                    f.write(f"{row}\n")
+
+    def delete(self, ids):
+        with self.lock:
+            self._tombstone(ids)
+
+    def _build_ivf(self):
+        n = len(self.ids)
+        n_clusters = max(16, int(np.sqrt(n)))
+        sample_rows = np.random.default_rng(0).choice(n, min(n, 50 * n_clusters), replace=False)
+        centroids = _kmeans(np.asarray(self.vectors[np.sort(sample_rows)], dtype=np.float32), n_clusters)
+        assign = np.empty(n, dtype=np.int32)
+        for start in range(0, n, SEARCH_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        np.savez(self._file("ivf.npz"), centroids=centroids, assign=assign, size=n)
+        self.ivf = {"centroids": centroids, "assign": assign, "size": n}
+        print(f"DEBUG: Built IVF index ({n_clusters} lists) over {n} vectors in {self.path}")
+
+    def _scan(self, rows, query):
+        """Exact scores for the given row indices (or all rows if rows is None)."""
+        if rows is None:
+            scores = np.empty(len(self.ids), dtype=np.float32)
+            for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+                block = np.asarray(self.vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+                scores[start:start + len(block)] = block @ query
+            return np.arange(len(self.ids)), scores
+        return rows, np.asarray(self.vectors[rows], dtype=np.float32) @ query
+
+    def search(self, query_vector, k):
+        with self.lock:
+            if self.vectors is None or self.live_count == 0:
+                return []
+            query = np.asarray(query_vector, dtype=np.float32)
+            query /= np.linalg.norm(query) or 1.0
+
+            if self.ivf is not None:
+                probe = np.argsort(self.ivf["centroids"] @ query)[::-1][:IVF_NPROBE]
+                indexed = np.nonzero(np.isin(self.ivf["assign"], probe))[0]
+                tail = np.arange(self.ivf["size"], len(self.ids))  # rows added after the last build
+                rows, scores = self._scan(np.sort(np.concatenate([indexed, tail])), query)
+            else:
+                rows, scores = self._scan(None, query)
+
+            if self.deleted:
+                alive = ~np.isin(rows, list(self.deleted))
+                rows, scores = rows[alive], scores[alive]
+            if not len(rows):
+                return []
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            hits = [(int(rows[i]), float(scores[i])) for i in top]
+
+            results = []
+            with open(self._file("payload.jsonl"), "rb") as f:
+                for row, score in hits:
+                    f.seek(self.offsets[row])
+                    payload = json.loads(f.readline())
+                    metadata = payload.get("metadata", {})
+                    metadata["chunk_id"] = self.ids[row]
+                    results.append((Document(page_content=payload["page_content"], metadata=metadata), score))
+            return results
+
+
+class LocalVectorBackend:
+    """In-process vector store: one memory-mapped TenantIndex per user, no server needed."""
+
+    name = "local"
+
+    def __init__(self, dim, root=LOCAL_INDEX_DIR, dtype=LOCAL_VECTOR_DTYPE):
+        self.dim = dim
+        self.root = root
+        self.dtype = dtype
+        self.tenants = {}
+        self.lock = threading.Lock()
+
+    def _tenant(self, user_id):
+        tenant = self.tenants.get(user_id)
+        if tenant is None:
+            with self.lock:
+                tenant = self.tenants.get(user_id)
+                if tenant is None:
+                    # hashed so any user id is a safe directory name
+                    folder = hashlib.sha1(str(user_id).encode()).hexdigest()[:16]
+                    tenant = self.tenants[user_id] = TenantIndex(os.path.join(self.root, folder), self.dim, self.dtype)
+        return tenant
+
+    def add(self, user_id, ids, vectors, docs):
+        payloads = [{"page_content": d.page_content, "metadata": d.metadata} for d in docs]
+        self._tenant(user_id).add(ids, vectors, payloads)
+
+    def search(self, user_id, query_vector, k):
+        return self._tenant(user_id).search(query_vector, k)
+
+    def delete(self, user_id, ids):
+        self._tenant(user_id).delete(ids)
+
+    def count(self, user_id):
+        return self._tenant(user_id).live_count
+
+    def health(self):
+        return {"status": "ok", "backend": self.name, "path": self.root, "loaded_tenants": len(self.tenants)}
+
+
+if __name__ == "__main__":
+    # Search latency of the local backend vs. Qdrant on random unit vectors:
+    #   python local_index.py [sizes...]     (default 10000 100000 1000000; Qdrant is skipped if unreachable)
+    import tempfile
+    import uuid
+    from vector_store import QdrantVectorBackend
+
+    sizes = [int(s) for s in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    dim, queries, k = 384, 50, 15
+    rng = np.random.default_rng(0)
+    query_vectors = rng.standard_normal((queries, dim)).astype(np.float32)
+
+    try:
+        QdrantVectorBackend(dim).client.get_collections()
+        use_qdrant = True
+    except Exception as e:
+        print(f"Qdrant skipped: {e}")
+        use_qdrant = False
+
+    for n in sizes:
+        backends = [LocalVectorBackend(dim, root=tempfile.mkdtemp())]
+        if use_qdrant:
+            backends.append(QdrantVectorBackend(dim, collection_name=f"bench-{uuid.uuid4().hex[:8]}"))
+        for backend in backends:
+            user_id = f"bench-{n}"
+            started = time.perf_counter()
+            for start in range(0, n, 10_000):
+                count = min(10_000, n - start)
+                vectors = rng.standard_normal((count, dim)).astype(np.float32)
+                ids = [str(uuid.uuid4()) for _ in range(count)]
+                docs = [Document(page_content=f"chunk {start + i}", metadata={"user_id": user_id}) for i in range(count)]
+                backend.add(user_id, ids, vectors, docs)
+            load_s = time.perf_counter() - started
+
+            latencies = []
+            for q in query_vectors:
+                t = time.perf_counter()
+                backend.search(user_id, q, k)
+                latencies.append(time.perf_counter() - t)
+            latencies.sort()
+            print(f"{backend.name:7s} n={n:<8d} load={load_s:7.1f}s  p50={latencies[len(latencies) // 2] * 1000:7.2f}ms  "
+                  f"p95={latencies[int(len(latencies) * 0.95)] * 1000:7.2f}ms")
+            if backend.name == "qdrant":
+                backend.client.delete_collection(backend.collection_name)
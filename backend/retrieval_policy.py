@@ -0,0 +1,152 @@
+import os
+import re
+import sys
+import time
+from langchain_core.documents import Document
+from telemetry import retrieval_events
+
+ADAPTIVE_RETRIEVAL = os.getenv("ADAPTIVE_RETRIEVAL", "true").lower() == "true"
+DENSE_MIN_K = int(os.getenv("DENSE_MIN_K", "4"))                        # never keep fewer dense candidates than this
+DENSE_SCORE_MARGIN = float(os.getenv("DENSE_SCORE_MARGIN", "0.2"))      # keep dense hits within this cosine of the best
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.6"))      # shingle containment that counts as a duplicate
+CHUNK_OVERLAP_MIN_CHARS = int(os.getenv("CHUNK_OVERLAP_MIN_CHARS", "50"))  # shortest shared chunk boundary that is stripped
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "3"))                      # snippets returned to the agent
+RERANK_STAGE_SIZE = int(os.getenv("RERANK_STAGE_SIZE", "4"))            # candidates scored per CrossEncoder stage
+RERANK_CONFIDENT_SCORE = float(os.getenv("RERANK_CONFIDENT_SCORE", "3.0"))  # top-N all above this -> stop reranking
+RERANK_MIN_SCORE = float(os.getenv("RERANK_MIN_SCORE", "-5.0"))         # CrossEncoder logit below which a snippet is junk
+
+
+def select_dense_candidates(scored, min_k=DENSE_MIN_K, margin=DENSE_SCORE_MARGIN):
+    """
+    Trims a dense result list [(doc, cosine)] by its score distribution: hits far below the best
+    one are dropped, so a dominant match sends only a few candidates on, a flat list keeps them all.
+    """
+    if not ADAPTIVE_RETRIEVAL or not scored:
+        return [doc for doc, _ in scored]
+    best = scored[0][1]
+    kept = [doc for i, (doc, score) in enumerate(scored) if i < min_k or score >= best - margin]
+    if len(kept) < len(scored):
+        retrieval_events.inc(len(scored) - len(kept), event="dense_trimmed")
+    return kept
+
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    return {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _boundary_overlap(first, second, min_chars):
+    """Length of the longest end of `first` that `second` starts with (0 if shorter than min_chars)."""
+    if min(len(first), len(second)) < min_chars:
+        return 0
+    head = second[:min_chars]
+    start = first.find(head, max(0, len(first) - len(second)))
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(head, start + 1)
+    return 0
+
+
+def strip_chunk_overlap(text, kept_texts, min_chars=CHUNK_OVERLAP_MIN_CHARS):
+    """
+    Removes the text a chunk shares with a higher-ranked neighbour: the splitter repeats up to
+    chunk_overlap characters across a chunk boundary, either at the start (this chunk follows a
+    kept one) or at the end (it precedes one).
+    """
+    for other in kept_texts:
+        head = _boundary_overlap(other, text, min_chars)
+        if head:
+            text = text[head:].lstrip()
+        tail = _boundary_overlap(text, other, min_chars)
+        if tail:
+            text = text[:len(text) - tail].rstrip()
+    return text
+
+
+def suppress_near_duplicates(docs, threshold=NEAR_DUP_THRESHOLD):
+    """
+    Strips the chunk overlap a candidate shares with higher-ranked neighbours, then drops it if
+    what is left is mostly contained in a higher-ranked one (the same passage uploaded twice).
+    """
+    if not ADAPTIVE_RETRIEVAL:
+        return docs
+    kept, kept_shingles = [], []
+    for doc in docs:
+        text = strip_chunk_overlap(doc.page_content, [other.page_content for other in kept])
+        if text != doc.page_content:
+            retrieval_events.inc(event="overlap_stripped")
+            if not text:
+                retrieval_events.inc(event="duplicate_dropped")
+                continue
+            doc = Document(page_content=text, metadata=doc.metadata)  # the caller's copy stays intact
+        shingles = _shingles(text)
+        if any(len(shingles & other) / len(shingles) >= threshold for other in kept_shingles):
+            retrieval_events.inc(event="duplicate_dropped")
+            continue
+        kept.append(doc)
+        kept_shingles.append(shingles)
+    return kept
+
+
+def staged_rerank(query, docs, score_pairs, top_n=RERANK_TOP_N, stage_size=RERANK_STAGE_SIZE,
+                  confident=RERANK_CONFIDENT_SCORE, min_score=RERANK_MIN_SCORE):
+    """
+    Reranks docs (in first-stage order) a few at a time with score_pairs([[query, text], ...]).
+    Stops once top_n scored snippets are all above `confident`, since lower-ranked candidates rarely
+    overtake them. Returns up to top_n (doc, score) pairs, best first, excluding anything below min_score.
+    """
+    if not ADAPTIVE_RETRIEVAL:
+        stage_size, confident, min_score = len(docs) or 1, float("inf"), float("-inf")
+
+    scored = []
+    for start in range(0, len(docs), stage_size):
+        stage = docs[start:start + stage_size]
+        scores = score_pairs([[query, doc.page_content] for doc in stage])
+        scored.extend(zip(stage, (float(s) for s in scores)))
+        retrieval_events.inc(len(stage), event="pairs_scored")
+        scored.sort(key=lambda x: x[1], reverse=True)
+        remaining = len(docs) - start - len(stage)
+        if remaining and len(scored) >= top_n and scored[top_n - 1][1] >= confident:
+            retrieval_events.inc(event="early_exit")
+            retrieval_events.inc(remaining, event="pairs_skipped")
+            break
+
+    top = [(doc, score) for doc, score in scored[:top_n] if score >= min_score]
+    if len(top) < min(top_n, len(scored)):
+        retrieval_events.inc(min(top_n, len(scored)) - len(top), event="below_min_score")
+    return top
+
+
+def retrieval_stats():
+    stats = {key[0]: value for key, value in retrieval_events.values.items()}
+    scored, skipped = stats.get("pairs_scored", 0), stats.get("pairs_skipped", 0)
+    stats["rerank_pairs_saved"] = round(skipped / (scored + skipped), 4) if scored + skipped else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    # Rerank CPU time of the adaptive policy vs. scoring every candidate:  python retrieval_policy.py [queries]
+    from inference import CHECK_SET, load_reranker
+
+    reranker = load_reranker()
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    filler = [
+        "The quarterly newsletter covers office events and upcoming holidays.",
+        "Parking permits are renewed every January at the front desk.",
+        "The cafeteria menu changes weekly and is posted on Mondays.",
+        "Printer drivers can be installed from the IT self-service portal.",
+        "Meeting rooms must be booked at least one day in advance.",
+        "Fire drills happen twice a year; follow the marked exits.",
+    ]
+    for label, adaptive in (("full rerank", False), ("adaptive", True)):
+        ADAPTIVE_RETRIEVAL = adaptive
+        started = time.process_time()
+        returned = 0
+        for _ in range(rounds):
+            for query, passages in CHECK_SET:
+                docs = [Document(page_content=p) for p in passages + filler]
+                docs = suppress_near_duplicates(docs)
+                returned += len(staged_rerank(query, docs, reranker.predict))
+        print(f"{label:12s} cpu={time.process_time() - started:6.2f}s  snippets returned={returned}")
+    print(retrieval_stats())
@@ -1,10 +1,34 @@
+from file_processor import start_parse_pool
+start_parse_pool() # fork the parser processes while this process has no other threads yet
+
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
 from api import auth,documents,chat
+from write_behind import persistence_queue
+from ingestion_jobs import ingestion_queue
+from telemetry import render_metrics
+from tools import vector_service
+from fastapi.concurrency import run_in_threadpool
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    persistence_queue.start()
+    ingestion_queue.start() # also resumes uploads interrupted by the last shutdown
+    try:
+        # creates the knowledge-base collection and its tenant index up front
+        await run_in_threadpool(vector_service.prepare)
+    except Exception as e:
+        print(f"DEBUG: Vector store not ready at startup: {e}")
+    yield
+    ingestion_queue.stop()
+    # finish saving chat history / memories before the process exits
+    await persistence_queue.stop()
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,5 +42,16 @@ app.include_router(auth.router, tags=["Authentication"])
 app.include_router(documents.router, tags=["Documents"])
 app.include_router(chat.router, tags=["Chat Engine"])
 
+@app.get("/health", tags=["Monitoring"])
+async def health():
+    """Liveness plus a round trip to the knowledge-base vector backend."""
+    vectors = await run_in_threadpool(vector_service.health)
+    return {"status": vectors["status"], "vector_store": vectors, "ingestion": ingestion_queue.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Monitoring"])
+async def metrics():
+    """Prometheus scrape endpoint: per-stage latency histograms, token, cache and error counters."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=5000)
\ No newline at end of file
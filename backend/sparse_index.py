@@ -0,0 +1,160 @@
+import json
+import math
+import os
+import re
+import sqlite3
+from collections import Counter
+from langchain_core.documents import Document
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "has", "have", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "with", "you", "your",
+}
+
+# keeps identifiers like "E1042", "v2.3.1" or "INV-2024-001" as single terms
+TOKEN_RE = re.compile(r"\w+(?:[-./]\w+)*")
+
+
+def tokenize(text: str):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class SparseIndex:
+    """
+    Lexical (BM25) index over the same chunks that go to Qdrant, kept in a local SQLite file.
+    Catches exact terms (names, IDs, error codes) that dense embeddings blur. Every query is
+    restricted to one user's chunks, like the dense search.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            self.db_path = os.path.join(os.path.dirname(__file__), "data", "sparse_index.db")
+        else:
+            self.db_path = db_path
+        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self.init_database()
+
+    def init_database(self):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                length INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS postings (
+                user_id TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_postings_user_term ON postings (user_id, term)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings (chunk_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunks_user ON chunks (user_id)')
+        conn.commit()
+        conn.close()
+
+    def add(self, user_id: str, docs, ids):
+        """Indexes chunks under the same ids they have in the vector store."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            for chunk_id, doc in zip(ids, docs):
+                terms = Counter(tokenize(doc.page_content))
+                cursor.execute(
+                    'INSERT OR REPLACE INTO chunks (chunk_id, user_id, content, metadata, length) VALUES (?, ?, ?, ?, ?)',
+                    (chunk_id, user_id, doc.page_content, json.dumps(doc.metadata, default=str), sum(terms.values())),
+                )
+                cursor.execute('DELETE FROM postings WHERE chunk_id = ?', (chunk_id,))
+                cursor.executemany(
+                    'INSERT INTO postings (user_id, term, chunk_id, tf) VALUES (?, ?, ?, ?)',
+                    [(user_id, term, chunk_id, tf) for term, tf in terms.items()],
+                )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete(self, ids):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.executemany('DELETE FROM postings WHERE chunk_id = ?', [(i,) for i in ids])
+            cursor.executemany('DELETE FROM chunks WHERE chunk_id = ?', [(i,) for i in ids])
+            conn.commit()
+        finally:
+            conn.close()
+
+    def search(self, user_id: str, query: str, k: int = 15):
+        """BM25 top-k over the user's chunks, as LangChain Documents (chunk id in metadata)."""
+        terms = list(set(tokenize(query)))
+        if not terms:
+            return []
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*), AVG(length) FROM chunks WHERE user_id = ?', (user_id,))
+            n_docs, avg_len = cursor.fetchone()
+            if not n_docs:
+                return []
+
+            placeholders = ",".join("?" * len(terms))
+            cursor.execute(f'''
+                SELECT p.term, p.chunk_id, p.tf, c.length
+                FROM postings p JOIN chunks c ON c.chunk_id = p.chunk_id
+                WHERE p.user_id = ? AND p.term IN ({placeholders})
+            ''', (user_id, *terms))
+            rows = cursor.fetchall()
+
+            df = Counter(term for term, _, _, _ in rows)
+            scores = Counter()
+            for term, chunk_id, tf, length in rows:
+                idf = math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5))
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / (avg_len or 1))
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / norm
+
+            top = scores.most_common(k)
+            if not top:
+                return []
+            top_ids = [chunk_id for chunk_id, _ in top]
+            cursor.execute(
+                f'SELECT chunk_id, content, metadata FROM chunks WHERE chunk_id IN ({",".join("?" * len(top_ids))})',
+                top_ids,
+            )
+            by_id = {row[0]: row for row in cursor.fetchall()}
+        finally:
+            conn.close()
+
+        results = []
+        for chunk_id in top_ids:
+            _, content, metadata = by_id[chunk_id]
+            metadata = json.loads(metadata)
+            metadata["chunk_id"] = chunk_id
+            results.append(Document(page_content=content, metadata=metadata))
+        return results
+
+
+def reciprocal_rank_fusion(result_lists, k: int = 60):
+    """
+    Merges ranked lists of Documents: each document scores sum(1 / (k + rank)) over the lists it
+    appears in. Documents are matched by chunk id, or by their text for chunks indexed before ids existed.
+    """
+    scores, docs = {}, {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+sparse_index = SparseIndex()
@@ -0,0 +1,165 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = []
+_lock = threading.Lock()
+
+
+def _label_str(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{k}="{v}"' for k, v in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter in the Prometheus text format, with optional labels."""
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_label_str(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format."""
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values -> [bucket counts..., sum, count]
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with _lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self.series.items()):
+            names = self.labelnames + ("le",)
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_label_str(names, key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_label_str(names, key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_label_str(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_label_str(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def render_metrics():
+    """All registered metrics as Prometheus text exposition."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+stage_latency = Histogram("rag_stage_latency_seconds", "Latency of each chat/ingestion stage", ["stage"])
+llm_tokens = Counter("rag_llm_tokens_total", "Groq tokens used", ["direction"])
+cache_lookups = Counter("rag_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+errors = Counter("rag_errors_total", "Errors by stage", ["stage"])
+requests = Counter("rag_requests_total", "Chat requests by endpoint", ["endpoint"])
+ingest_chunks = Counter("rag_ingest_chunks_total", "Chunks embedded / reused / deleted by ingestion", ["result"])
+context_tokens = Counter("rag_context_tokens_total", "Knowledge-base context tokens before/after compression", ["stage"])
+retrieval_events = Counter("rag_retrieval_events_total", "Adaptive retrieval decisions (pairs scored/skipped, early exits...)", ["event"])
+
+
+# ---- per-request tracing ----
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+class RequestTrace:
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans = []  # (stage, offset ms, duration ms)
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        duration = end - self.start
+        stage_latency.observe(duration, stage=self.stage)
+        if exc_type is not None:
+            errors.inc(stage=self.stage)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append((self.stage, round((self.start - trace.start) * 1000, 1), round(duration * 1000, 1)))
+        return False
+
+
+_NOOP = nullcontext()
+
+
+def span(stage: str):
+    """Times a block of work: `with span("qdrant_search"): ...`. Free when tracing is disabled."""
+    if not TRACING_ENABLED:
+        return _NOOP
+    return _Span(stage)
+
+
+def start_trace(name: str):
+    """Starts collecting spans for the current request (the current task and anything it spawns)."""
+    if not TRACING_ENABLED:
+        return None
+    trace = RequestTrace(name)
+    _current_trace.set(trace)
+    return trace
+
+
+def finish_trace(trace, **attrs):
+    """Records the total request latency and logs the span breakdown."""
+    if trace is None:
+        return
+    total = time.perf_counter() - trace.start
+    stage_latency.observe(total, stage=trace.name)
+    summary = {"total_ms": round(total * 1000, 1), **attrs, "spans": trace.spans}
+    print(f"DEBUG: trace {trace.name} {json.dumps(summary, default=str)}")
+
+
+def record_llm_usage(message):
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        llm_tokens.inc(usage.get("input_tokens", 0), direction="in")
+        llm_tokens.inc(usage.get("output_tokens", 0), direction="out")
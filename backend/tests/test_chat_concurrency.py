@@ -0,0 +1,146 @@
+"""
+A slow /chat must not stall other endpoints served by the same event loop.
+
+The model work (query embedding, Mem0 search) is replaced by fakes that block their thread, and the
+LLM by a fake that takes seconds to answer, then /conversations is called while /chat is in flight.
+"""
+import asyncio
+import importlib
+import sys
+import time
+import types
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from langchain_core.messages import AIMessage
+
+SLOW_SECONDS = 1.0
+
+
+class StubGroqClient:
+    def with_options(self, **options):
+        return self
+
+
+class SlowMemory:
+    """Mem0 stand-in: search blocks like a local embedding + vector search would."""
+
+    llm = types.SimpleNamespace(client=StubGroqClient())
+
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def search(self, query, user_id, limit=3):
+        time.sleep(SLOW_SECONDS)
+        return []
+
+    def add(self, user_id, messages):
+        return {}
+
+
+class SlowEmbeddings:
+    """Embedding stand-in whose forward pass blocks its thread for a while."""
+
+    dimension = 4
+
+    def embed_query(self, text):
+        time.sleep(SLOW_SECONDS)
+        return [1.0, 0.0, 0.0, 0.0]
+
+    def stats(self):
+        return {}
+
+
+class SlowLLM:
+    """Groq stand-in: answers without tool calls after a long network wait."""
+
+    async def ainvoke(self, messages, config=None):
+        await asyncio.sleep(SLOW_SECONDS)
+        return AIMessage(content="slow answer")
+
+
+class StubBatcher:
+    def stats(self):
+        return {}
+
+
+def stub_module(monkeypatch, name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    monkeypatch.setitem(sys.modules, name, module)
+
+
+@pytest.fixture
+def chat(monkeypatch, tmp_path):
+    # api.chat builds Mem0 (Qdrant), the MiniLM embedder and, through tools, the CrossEncoder,
+    # the vector backend and the BM25 index when imported; none of them are needed here
+    stub_module(monkeypatch, "mem0", Memory=SlowMemory)
+    stub_module(monkeypatch, "embeddings", embedding_service=SlowEmbeddings())
+
+    async def no_prefetch(query, user_id):
+        return None
+
+    stub_module(
+        monkeypatch, "tools",
+        tools_list=[],
+        prefetch_candidates=no_prefetch,
+        user_has_documents=lambda user_id: False,
+        rerank_batcher=StubBatcher(),
+    )
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    # the shared db is created when database is imported, so import it fresh against tmp_path
+    monkeypatch.setenv("USERS_DB_PATH", str(tmp_path / "users.db"))
+    for name in ("database", "api.auth", "api.chat"):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    chat_module = importlib.import_module("api.chat")
+
+    monkeypatch.setattr(chat_module, "verify_token", lambda authorization: ("user-1", "alice"))
+    monkeypatch.setattr(chat_module, "llm", SlowLLM())
+    monkeypatch.setattr(chat_module, "llm_with_tools", SlowLLM())
+    monkeypatch.setattr(chat_module, "INTENT_ROUTER_ENABLED", False)
+    monkeypatch.setattr(chat_module, "SPECULATIVE_PREFETCH", False)
+    monkeypatch.setattr(chat_module, "ANSWER_CACHE_ENABLED", True)
+
+    async def no_persistence(*args):
+        return None
+
+    monkeypatch.setattr(chat_module, "save_exchange", no_persistence)
+    return chat_module, chat_module.db
+
+
+def test_slow_chat_does_not_stall_conversation_listing(chat):
+    chat_module, db = chat
+    app = FastAPI()
+    app.include_router(chat_module.router)
+    conv_id = db.create_conversation("user-1")
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+            started = time.perf_counter()
+            chat_request = asyncio.create_task(
+                client.post("/chat", json={"message": "what is in my notes?", "conversation_id": conv_id})
+            )
+            await asyncio.sleep(0.2)  # the chat is now inside the (blocking) query embedding
+
+            listed_at = time.perf_counter()
+            listing = await client.get("/conversations")
+            listing_seconds = time.perf_counter() - listed_at
+            chat_in_flight = not chat_request.done()
+
+            answer = await chat_request
+            return listing, listing_seconds, chat_in_flight, answer, time.perf_counter() - started
+
+    listing, listing_seconds, chat_in_flight, answer, chat_seconds = asyncio.run(scenario())
+
+    assert listing.status_code == 200
+    assert [c["id"] for c in listing.json()["conversations"]] == [conv_id]
+    assert chat_in_flight, "the chat finished before the listing, the test did not overlap them"
+    assert listing_seconds < SLOW_SECONDS / 2, f"/conversations took {listing_seconds:.2f}s behind a slow chat"
+
+    assert answer.json()["response"] == "slow answer"
+    # embedding + Mem0 search + LLM call, each SLOW_SECONDS, all ran
+    assert chat_seconds >= 3 * SLOW_SECONDS
@@ -1,35 +1,58 @@
 from datetime import datetime
+import asyncio
+import os
+import re
+import time
 from langchain_core.tools import tool
-from langchain_community.tools import TavilySearchResults
 import wikipedia
-from langchain_qdrant import QdrantVectorStore
-from langchain_huggingface import HuggingFaceEmbeddings
-from sentence_transformers import CrossEncoder 
 from langchain_core.runnables import RunnableConfig #secure back channel
-from qdrant_client.http import models #we can not simply say filter using user_id to qdrant, so to make the format of the filter we require this.
+from concurrency import run_in_model_executor
+from telemetry import span
+from vector_store import VectorStoreService
+from chunk_store import chunk_store, CHUNK_STORE_ENABLED
+from embeddings import embedding_service
+from batching import MicroBatcher, split_by_lengths
+from inference import load_reranker
+from sparse_index import sparse_index, reciprocal_rank_fusion
+from web_search import web_search_client
+from context_compression import compress_snippets
+from retrieval_policy import select_dense_candidates, suppress_near_duplicates, staged_rerank
 
 
-embedding_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-MiniLM-L6-v2"
-)
-reranker = CrossEncoder('cross-encoder/ms-marco-MiniLM-L-6-v2') #classification model (act as grader and gives score)
+reranker = load_reranker() #classification model (act as grader and gives score), torch or ONNX per INFERENCE_BACKEND
+vector_service = VectorStoreService(embedding_service, chunk_store=chunk_store if CHUNK_STORE_ENABLED else None) #one shared vector backend (Qdrant or local, per VECTOR_BACKEND) for search and ingestion
+
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "128"))  # query-document pairs per CrossEncoder pass
+
+def _rerank_batch(requests):
+    """Scores the pairs of several concurrent searches in one CrossEncoder call."""
+    scores = reranker.predict([pair for pairs in requests for pair in pairs])
+    return split_by_lengths(list(scores), [len(pairs) for pairs in requests])
+
+rerank_batcher = MicroBatcher("rerank", _rerank_batch, max_batch_size=RERANK_MAX_BATCH, weight=len)
+
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # dense + BM25, fused with RRF
+DENSE_K = int(os.getenv("DENSE_K", "15"))  # upper bound; trimmed by score in select_dense_candidates
+SPARSE_K = int(os.getenv("SPARSE_K", "15"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+RERANK_POOL = int(os.getenv("RERANK_POOL", "10"))  # fused candidates sent to the CrossEncoder
+
+# how close the agent's search query must be to the user's message to reuse pre-fetched candidates (token Jaccard)
+PREFETCH_MATCH_THRESHOLD = float(os.getenv("PREFETCH_MATCH_THRESHOLD", "0.8"))
 
 @tool
 def get_current_time():
     """Get the current real-time date and time."""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 @tool
-def web_search(query: str):
+async def web_search(query: str):
     """
     Search the internet for real-time information, news, weather, or facts.
     Use this when the user asks about current events or topics you don't know.
     """
     try:
-        
-        tool = TavilySearchResults(max_results=3)
-        # this automatically access the api_key.
-
-        results = tool.invoke({"query": query})
+        # shared client: cached per query, coalesced, time-limited and concurrency-capped
+        results = await web_search_client.search(query)
         output = []
         for res in results:
             output.append(f"Source: {res.get('url')}\nContent: {res.get('content')}")
@@ -58,44 +81,108 @@ def web_search(query: str):
 #         return f"Wikipedia search failed: {str(e)}"
     
 
+_has_documents = {}  # user_id -> (has documents, checked at)
+
+def user_has_documents(user_id: str):
+    """Cheap check whether a user has anything in the knowledge base (negative answers are re-checked after a minute)."""
+    cached = _has_documents.get(user_id)
+    if cached and (cached[0] or time.time() - cached[1] < 60):
+        return cached[0]
+    try:
+        has_docs = vector_service.count_user_chunks(user_id) > 0
+    except Exception as e:
+        print(f"DEBUG: Document count failed: {e}")
+        has_docs = False
+    _has_documents[user_id] = (has_docs, time.time())
+    return has_docs
+
+def mark_user_has_documents(user_id: str):
+    _has_documents[user_id] = (True, time.time())
+
+def dense_search(query: str, user_id: str):
+    # timed apart, so qdrant_search is only the vector search itself
+    with span("query_embedding"):
+        query_vector = embedding_service.embed_query(query)
+    with span("qdrant_search"):
+        scored = vector_service.similarity_search_by_vector_with_score(query_vector, user_id, k=DENSE_K)
+    return select_dense_candidates(scored)
+
+def lexical_search(query: str, user_id: str):
+    with span("bm25_search"):
+        return sparse_index.search(user_id, query, k=SPARSE_K)
+
+async def retrieve_candidates(query: str, user_id: str):
+    """
+    Stage 1: dense search in Qdrant and BM25 over the same chunks, run in parallel and
+    fused with reciprocal rank fusion. Both are restricted to this user's documents.
+    """
+    if not HYBRID_SEARCH:
+        return await run_in_model_executor(dense_search, query, user_id)
+    dense, lexical = await asyncio.gather(
+        run_in_model_executor(dense_search, query, user_id),
+        run_in_model_executor(lexical_search, query, user_id),
+    )
+    return reciprocal_rank_fusion([dense, lexical], k=RRF_K)[:RERANK_POOL]
+
+def rerank_candidates(query: str, initial_results):
+    """Stage 2: CrossEncoder re-ranking in stages (see retrieval_policy), returns the top snippets as tool output."""
+    if not initial_results:
+        return "No relevant information found in the documents."
+
+    candidates = suppress_near_duplicates(initial_results)
+    print(f"DEBUG: Stage 1 found {len(initial_results)} snippets ({len(candidates)} distinct). Re-ranking...")
+
+    with span("rerank"):
+        top_docs = staged_rerank(query, candidates, rerank_batcher.submit)
+    if not top_docs:
+        print("DEBUG: No snippet passed the minimum rerank score")
+        return "No relevant information found in the documents."
+
+    print(f"DEBUG: Top snippet score after re-ranking: {top_docs[0][1]:.2f}")
+    with span("compress"):
+        context = compress_snippets(query, top_docs, embedding_service)
+    return context
+
+async def prefetch_candidates(query: str, user_id: str):
+    """
+    Speculatively runs stage 1 for the user's raw message at request start.
+    Returns None on failure, the tool will then simply search normally.
+    """
+    try:
+        docs = await retrieve_candidates(query, user_id)
+        return {"query": query, "docs": docs}
+    except Exception as e:
+        print(f"DEBUG: Knowledge base prefetch failed: {e}")
+        return None
+
+def _query_tokens(text: str):
+    return set(re.findall(r"\w+", text.lower()))
+
+def queries_match(a: str, b: str, threshold: float = PREFETCH_MATCH_THRESHOLD):
+    """True if two queries are the same or near-identical (case, punctuation and word order ignored)."""
+    ta, tb = _query_tokens(a), _query_tokens(b)
+    if not ta or not tb:
+        return False
+    return len(ta & tb) / len(ta | tb) >= threshold
+
 @tool
-def search_knowledge_base(query: str, config: RunnableConfig):
+async def search_knowledge_base(query: str, config: RunnableConfig):
     """
     Use this tool to search for information inside the uploaded PDF documents or text files.
     Input should be a specific search query related to the documents.
     Returns the relevant text snippets from the files using a Two-Stage Advanced RAG pipeline.
     """
     user_id = config.get("configurable", {}).get("user_id")
+    prefetched = config.get("configurable", {}).get("prefetched")
     print(f"DEBUG: Searching Knowledge Base for: '{query}',user:{user_id}")
     try:
-        vector_db = QdrantVectorStore.from_existing_collection(
-            embedding=embedding_model,
-            url="http://localhost:6333",
-            collection_name="learning-rag"
-        )
-        user_filter = models.Filter(
-            must=[
-                models.FieldCondition(
-                    key="metadata.user_id",
-                    match=models.MatchValue(value=user_id)
-                )
-            ]
-        )
-        initial_results = vector_db.similarity_search(query, k=15,filter=user_filter)
-        if not initial_results:
-            return "No relevant information found in the documents."
-        
-        print(f"DEBUG: Stage 1 found {len(initial_results)} snippets. Re-ranking...")
-
-        query_doc_pairs = [[query, doc.page_content] for doc in initial_results]
-        scores = reranker.predict(query_doc_pairs)
-        scored_docs = list(zip(initial_results, scores))
-        scored_docs.sort(key=lambda x: x[1], reverse=True)
-        top_3_docs = scored_docs[:3]
-
-        print(f"DEBUG: Top snippet score after re-ranking: {top_3_docs[0][1]:.2f}")
-        context = "\n\n".join([f"Snippet: {doc[0].page_content}" for doc in top_3_docs])
-        return context
+        # embedding + reranking are CPU heavy, keep them off the event loop
+        if prefetched and queries_match(query, prefetched["query"]):
+            print("DEBUG: Reusing pre-fetched knowledge base candidates")
+            candidates = prefetched["docs"]
+        else:
+            candidates = await retrieve_candidates(query, user_id)
+        return await run_in_model_executor(rerank_candidates, query, candidates)
 
     except Exception as e:
         return f"Error searching documents: {str(e)}"
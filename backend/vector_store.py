@@ -0,0 +1,439 @@
+import hashlib
+import os
+import sys
+import threading
+import time
+import uuid
+from langchain_core.documents import Document
+from qdrant_client import QdrantClient
+from qdrant_client.http import models
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()  # qdrant | local
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "learning-rag")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+QDRANT_TIMEOUT = int(os.getenv("QDRANT_TIMEOUT", "10"))
+QDRANT_POOL_SIZE = int(os.getenv("QDRANT_POOL_SIZE", "8"))  # connections shared by all requests
+# shared     : every user in one collection, filtered through the tenant index on metadata.user_id
+# collection : users above QDRANT_TENANT_PROMOTE_AT chunks get their own collection
+QDRANT_TENANT_MODE = os.getenv("QDRANT_TENANT_MODE", "shared").lower()
+QDRANT_TENANT_PROMOTE_AT = int(os.getenv("QDRANT_TENANT_PROMOTE_AT", "20000"))
+# seconds a user's collection routing is trusted before Qdrant is asked again; tenants can be moved
+# by the migrate/rebalance commands or another server process
+QDRANT_ROUTE_TTL = float(os.getenv("QDRANT_ROUTE_TTL", "30"))
+
+
+def user_filter(user_id: str):
+    """Restricts a Qdrant query to one user's chunks."""
+    return models.Filter(
+        must=[
+            models.FieldCondition(
+                key="metadata.user_id",
+                match=models.MatchValue(value=user_id)
+            )
+        ]
+    )
+
+
+def tenant_collection_name(base: str, user_id: str):
+    """Dedicated collection of a large tenant (hashed so any user id is a valid name)."""
+    return f"{base}-tenant-{hashlib.sha1(str(user_id).encode()).hexdigest()[:16]}"
+
+
+class QdrantVectorBackend:
+    """
+    One Qdrant client per process, shared by search and ingestion.
+
+    The client keeps a pool of keep-alive connections (or gRPC channels), so a search is a single
+    round trip instead of a new client plus a collection check every time. Points use the same
+    payload layout as langchain_qdrant ("page_content" / "metadata"), so existing collections work as is.
+
+    Every collection gets a tenant keyword index on metadata.user_id, so the per-user filter is an
+    index lookup instead of a scan. With QDRANT_TENANT_MODE=collection, a user whose chunk count
+    reaches QDRANT_TENANT_PROMOTE_AT is moved out of the shared collection into a dedicated one.
+    Routing is checked against Qdrant every QDRANT_ROUTE_TTL seconds (and right away when the shared
+    collection comes back empty), so moves made by other processes are picked up without a restart.
+    """
+
+    name = "qdrant"
+
+    def __init__(self, dim, url=QDRANT_URL, collection_name=QDRANT_COLLECTION, tenant_mode=QDRANT_TENANT_MODE):
+        self.dim = dim
+        self.url = url
+        self.collection_name = collection_name
+        self.tenant_mode = tenant_mode
+        self.client = QdrantClient(
+            url=url,
+            api_key=QDRANT_API_KEY,
+            prefer_grpc=QDRANT_PREFER_GRPC,
+            grpc_port=QDRANT_GRPC_PORT,
+            timeout=QDRANT_TIMEOUT,
+            pool_size=QDRANT_POOL_SIZE,  # sizes the keep-alive HTTP pool, or the gRPC channel pool
+        )
+        self.dedicated = set()  # names of existing per-tenant collections
+        self.routes = {}  # user_id -> (collection, checked at)
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def _create_collection(self, name):
+        """Creates a collection (cosine, embedding-sized vectors) if needed and makes sure it has the tenant index."""
+        if not self.client.collection_exists(name):
+            print(f"DEBUG: Creating Qdrant collection '{name}' (dim={self.dim})")
+            self.client.create_collection(
+                collection_name=name,
+                vectors_config=models.VectorParams(size=self.dim, distance=models.Distance.COSINE),
+            )
+        # no-op when the index already exists; is_tenant lets Qdrant co-locate each user's points
+        self.client.create_payload_index(
+            collection_name=name,
+            field_name="metadata.user_id",
+            field_schema=models.KeywordIndexParams(type=models.KeywordIndexType.KEYWORD, is_tenant=True),
+        )
+
+    def ensure_collection(self):
+        if self._ready:
+            return
+        with self._lock:
+            if not self._ready:
+                self._create_collection(self.collection_name)
+                prefix = f"{self.collection_name}-tenant-"
+                self.dedicated = {c.name for c in self.client.get_collections().collections if c.name.startswith(prefix)}
+                self._ready = True
+
+    def prepare(self):
+        """Called at startup so the collection and its payload index exist before the first request."""
+        self.ensure_collection()
+
+    def collection_for(self, user_id, refresh=False):
+        self.ensure_collection()
+        now = time.monotonic()
+        route = self.routes.get(user_id)
+        if refresh or route is None or now - route[1] > QDRANT_ROUTE_TTL:
+            name = tenant_collection_name(self.collection_name, user_id)
+            exists = self.client.collection_exists(name)
+            with self._lock:
+                if exists:
+                    self.dedicated.add(name)
+                else:
+                    self.dedicated.discard(name)
+            route = self.routes[user_id] = (name if exists else self.collection_name, now)
+        return route[0]
+
+    def add(self, user_id, ids, vectors, docs):
+        points = [
+            models.PointStruct(
+                id=chunk_id,
+                vector=list(map(float, vector)),
+                payload={"page_content": doc.page_content, "metadata": doc.metadata},
+            )
+            for chunk_id, vector, doc in zip(ids, vectors, docs)
+        ]
+        collection = self.collection_for(user_id, refresh=True)  # never write to a collection the user has left
+        self.client.upsert(collection_name=collection, points=points)
+        if self.tenant_mode == "collection" and collection == self.collection_name:
+            if self.count(user_id) >= QDRANT_TENANT_PROMOTE_AT:
+                self.migrate_tenant(user_id)
+
+    def search(self, user_id, query_vector, k):
+        collection = self.collection_for(user_id)
+        points = self._query(collection, user_id, query_vector, k)
+        if not points and collection == self.collection_name:
+            # the user may have just been moved to a dedicated collection by another process
+            moved = self.collection_for(user_id, refresh=True)
+            if moved != collection:
+                points = self._query(moved, user_id, query_vector, k)
+        results = []
+        for point in points:
+            payload = point.payload or {}
+            metadata = dict(payload.get("metadata") or {})
+            metadata["chunk_id"] = str(point.id)
+            results.append((Document(page_content=payload.get("page_content", ""), metadata=metadata), point.score))
+        return results
+
+    def _query(self, collection, user_id, query_vector, k):
+        return self.client.query_points(
+            collection_name=collection,
+            query=list(map(float, query_vector)),
+            query_filter=user_filter(user_id),
+            limit=k,
+            with_payload=True,
+        ).points
+
+    def delete(self, user_id, ids):
+        self.client.delete(
+            collection_name=self.collection_for(user_id, refresh=True),
+            points_selector=models.PointIdsList(points=list(ids)),
+        )
+
+    def count(self, user_id):
+        collection = self.collection_for(user_id)
+        if not self.client.collection_exists(collection):
+            return 0
+        return self.client.count(
+            collection_name=collection,
+            count_filter=user_filter(user_id),
+            exact=False,
+        ).count
+
+    def _copy_user_points(self, user_id, source, target, batch_size=256):
+        """Copies a user's points (vectors and payloads) from source to target; returns the copied ids."""
+        copied, offset = [], None
+        while True:
+            records, offset = self.client.scroll(
+                collection_name=source,
+                scroll_filter=user_filter(user_id),
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if records:
+                self.client.upsert(
+                    collection_name=target,
+                    points=[models.PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records],
+                )
+                copied.extend(r.id for r in records)
+            if offset is None:
+                return copied
+
+    def migrate_tenant(self, user_id):
+        """Moves one user from the shared collection into a dedicated collection; returns the points moved."""
+        self.ensure_collection()
+        target = tenant_collection_name(self.collection_name, user_id)
+        if self.collection_for(user_id, refresh=True) == target:
+            return 0
+        self._create_collection(target)
+        copied = self._copy_user_points(user_id, self.collection_name, target)
+        # from here on reads and writes for this user go to the dedicated collection
+        with self._lock:
+            self.dedicated.add(target)
+        self.routes[user_id] = (target, time.monotonic())
+        self._delete_ids(self.collection_name, copied)
+        # chunks written to the shared collection while the copy was running
+        late = self._copy_user_points(user_id, self.collection_name, target)
+        self._delete_ids(self.collection_name, late)
+        print(f"DEBUG: Moved {len(copied) + len(late)} chunks of user {user_id} to '{target}'")
+        return len(copied) + len(late)
+
+    def _delete_ids(self, collection, ids):
+        for start in range(0, len(ids), 1000):
+            self.client.delete(
+                collection_name=collection,
+                points_selector=models.PointIdsList(points=ids[start:start + 1000]),
+            )
+
+    def rebalance(self, threshold=QDRANT_TENANT_PROMOTE_AT):
+        """Moves every tenant of the shared collection with at least `threshold` chunks to its own collection."""
+        self.ensure_collection()
+        facets = self.client.facet(
+            collection_name=self.collection_name, key="metadata.user_id", limit=10000, exact=True
+        ).hits
+        large = [hit.value for hit in facets if hit.count >= threshold]
+        return {user_id: self.migrate_tenant(user_id) for user_id in large}
+
+    def health(self):
+        """Checks that Qdrant answers and reports the collection state."""
+        started = time.perf_counter()
+        try:
+            exists = self.client.collection_exists(self.collection_name)
+            info = {"status": "ok", "collection": self.collection_name, "collection_exists": exists}
+            if exists:
+                info["points"] = self.client.count(collection_name=self.collection_name, exact=False).count
+            info["tenant_mode"] = self.tenant_mode
+            info["dedicated_collections"] = len(self.dedicated)
+        except Exception as e:
+            info = {"status": "error", "collection": self.collection_name, "error": str(e)}
+        info["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        info["backend"] = self.name
+        info["url"] = self.url
+        info["grpc"] = QDRANT_PREFER_GRPC
+        return info
+
+
+def create_backend(name, dim):
+    if name == "qdrant":
+        return QdrantVectorBackend(dim)
+    if name == "local":
+        from local_index import LocalVectorBackend
+        return LocalVectorBackend(dim)
+    raise ValueError(f"Unknown VECTOR_BACKEND '{name}' (use qdrant or local)")
+
+
+class VectorStoreService:
+    """
+    Knowledge-base storage used by search and ingestion. Embeds text with the shared embedding
+    service and hands vectors to a backend (VECTOR_BACKEND):
+
+      qdrant : the Qdrant server (default)
+      local  : in-process memory-mapped NumPy index per user, see local_index.py
+
+    A backend implements add(user_id, ids, vectors, docs), search(user_id, vector, k) -> [(doc, score)],
+    delete(user_id, ids), count(user_id) and health().
+    """
+
+    def __init__(self, embedding, backend=VECTOR_BACKEND, chunk_store=None):
+        self.embedding = embedding
+        self.backend = create_backend(backend, embedding.dimension)
+        self.chunk_store = chunk_store  # keeps chunks + embeddings so collections can be rebuilt (chunk_store.py)
+        print(f"DEBUG: Knowledge base vector backend: {self.backend.name}")
+
+    def similarity_search_with_score(self, query: str, user_id: str, k: int = 15):
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), user_id, k)
+
+    def similarity_search_by_vector_with_score(self, query_vector, user_id: str, k: int = 15):
+        return self.backend.search(user_id, query_vector, k)
+
+    def similarity_search(self, query: str, user_id: str, k: int = 15):
+        return [doc for doc, _ in self.similarity_search_with_score(query, user_id, k)]
+
+    def add_documents(self, docs, ids=None, batch_size: int = 64):
+        """Embeds and stores chunks in batches; chunks are grouped by their metadata user_id."""
+        ids = ids or [str(uuid.uuid4()) for _ in docs]
+        for start in range(0, len(docs), batch_size):
+            batch_docs = docs[start:start + batch_size]
+            batch_ids = ids[start:start + batch_size]
+            vectors = self.embedding.embed_documents_batched([d.page_content for d in batch_docs])
+            by_user = {}
+            for chunk_id, vector, doc in zip(batch_ids, vectors, batch_docs):
+                by_user.setdefault(doc.metadata.get("user_id"), []).append((chunk_id, vector, doc))
+            for user_id, rows in by_user.items():
+                chunk_ids, user_vectors, user_docs = zip(*rows)
+                self.backend.add(user_id, list(chunk_ids), list(user_vectors), list(user_docs))
+                # only after the upsert succeeded: a failed batch is retried under new ids, and rows
+                # left behind here would come back as duplicates on the next reindex
+                if self.chunk_store is not None:
+                    self.chunk_store.append(user_id, list(chunk_ids), list(user_vectors), list(user_docs))
+        return ids
+
+    def delete(self, user_id: str, ids):
+        if ids:
+            self.backend.delete(user_id, ids)
+            if self.chunk_store is not None:
+                self.chunk_store.delete(user_id, ids)
+
+    def prepare(self):
+        prepare = getattr(self.backend, "prepare", None)
+        if prepare:
+            prepare()
+
+    def count_user_chunks(self, user_id: str):
+        return self.backend.count(user_id)
+
+    def health(self):
+        return self.backend.health()
+
+
+def _benchmark_filtered_search(tenant_counts, totals, dim=384, queries=50):
+    """Filtered search latency in one shared collection as tenants and chunks grow, with and without the tenant index."""
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    for total in totals:
+        for tenants in tenant_counts:
+            for indexed in (False, True):
+                backend = QdrantVectorBackend(dim, collection_name=f"bench-{uuid.uuid4().hex[:8]}")
+                backend.client.create_collection(
+                    collection_name=backend.collection_name,
+                    vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE),
+                )
+                if indexed:
+                    backend._create_collection(backend.collection_name)
+                backend._ready = True
+                for start in range(0, total, 1000):
+                    count = min(1000, total - start)
+                    vectors = rng.standard_normal((count, dim)).astype(np.float32)
+                    owners = rng.integers(0, tenants, count)
+                    backend.client.upsert(collection_name=backend.collection_name, points=[
+                        models.PointStruct(id=str(uuid.uuid4()), vector=v.tolist(),
+                                           payload={"page_content": "", "metadata": {"user_id": f"user-{o}"}})
+                        for v, o in zip(vectors, owners)
+                    ])
+                latencies = []
+                for q in rng.standard_normal((queries, dim)).astype(np.float32):
+                    t = time.perf_counter()
+                    backend.search(f"user-{rng.integers(0, tenants)}", q, 15)
+                    latencies.append(time.perf_counter() - t)
+                latencies.sort()
+                print(f"chunks={total:<8d} tenants={tenants:<6d} index={'yes' if indexed else 'no ':3s}  "
+                      f"p50={latencies[len(latencies) // 2] * 1000:7.2f}ms  p95={latencies[int(len(latencies) * 0.95)] * 1000:7.2f}ms")
+                backend.client.delete_collection(backend.collection_name)
+
+
+def _benchmark_client_overhead(points=2000, dim=384, queries=100, url=QDRANT_URL):
+    """
+    Per-query cost of the old search path (QdrantVectorStore.from_existing_collection, i.e. a new
+    client and a collection check, on every call) vs. the shared pooled client. Both search the same
+    precomputed vectors, so the difference is client setup and round trips, not embedding.
+    """
+    import numpy as np
+    from langchain_core.embeddings import Embeddings
+    from langchain_qdrant import QdrantVectorStore
+
+    class FixedEmbeddings(Embeddings):
+        def embed_documents(self, texts):
+            return [[0.0] * dim for _ in texts]
+
+        def embed_query(self, text):
+            return [0.0] * dim
+
+    rng = np.random.default_rng(0)
+    backend = QdrantVectorBackend(dim, url=url, collection_name=f"bench-{uuid.uuid4().hex[:8]}")
+    backend._create_collection(backend.collection_name)
+    backend._ready = True
+    for start in range(0, points, 500):
+        count = min(500, points - start)
+        backend.client.upsert(collection_name=backend.collection_name, points=[
+            models.PointStruct(id=str(uuid.uuid4()), vector=v.tolist(),
+                               payload={"page_content": "", "metadata": {"user_id": f"user-{i % 10}"}})
+            for i, v in enumerate(rng.standard_normal((count, dim)).astype(np.float32))
+        ])
+    query_vectors = rng.standard_normal((queries, dim)).astype(np.float32).tolist()
+
+    def per_call_store(user_id, vector):
+        store = QdrantVectorStore.from_existing_collection(
+            embedding=FixedEmbeddings(), url=url, api_key=QDRANT_API_KEY, collection_name=backend.collection_name
+        )
+        return store.similarity_search_by_vector(vector, k=15, filter=user_filter(user_id))
+
+    try:
+        for label, search in (("per-call client", per_call_store), ("shared client", lambda u, v: backend.search(u, v, 15))):
+            search("user-0", query_vectors[0])  # warm-up
+            latencies = []
+            for i, vector in enumerate(query_vectors):
+                t = time.perf_counter()
+                search(f"user-{i % 10}", vector)
+                latencies.append(time.perf_counter() - t)
+            latencies.sort()
+            print(f"{label:16s} queries={queries}  p50={latencies[len(latencies) // 2] * 1000:7.2f}ms  "
+                  f"p95={latencies[int(len(latencies) * 0.95)] * 1000:7.2f}ms  mean={sum(latencies) / len(latencies) * 1000:7.2f}ms")
+    finally:
+        backend.client.delete_collection(backend.collection_name)
+
+
+if __name__ == "__main__":
+    # python vector_store.py index               -> create the tenant payload index on the shared collection
+    # python vector_store.py migrate <user_id>   -> move one user to a dedicated collection
+    # python vector_store.py rebalance [n]       -> move every user with >= n chunks (default QDRANT_TENANT_PROMOTE_AT)
+    # python vector_store.py bench [chunks...]   -> filtered search latency vs. tenant and chunk count
+    # python vector_store.py overhead [queries]  -> per-query cost of a new client per search vs. the shared one
+    command = sys.argv[1] if len(sys.argv) > 1 else "index"
+    if command == "bench":
+        _benchmark_filtered_search([10, 100, 1000], [int(n) for n in sys.argv[2:]] or [10_000, 100_000])
+        sys.exit()
+    if command == "overhead":
+        _benchmark_client_overhead(queries=int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+        sys.exit()
+
+    probe = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY)
+    dim = probe.get_collection(QDRANT_COLLECTION).config.params.vectors.size
+    backend = QdrantVectorBackend(dim)
+    backend.prepare()
+    if command == "migrate":
+        print(backend.migrate_tenant(sys.argv[2]))
+    elif command == "rebalance":
+        print(backend.rebalance(int(sys.argv[2]) if len(sys.argv) > 2 else QDRANT_TENANT_PROMOTE_AT))
+    else:
+        print(backend.health())
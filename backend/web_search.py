@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from telemetry import cache_lookups, errors, span
+
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "600"))  # seconds; news and weather go stale fast
+WEB_SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "2000"))
+WEB_SEARCH_TIMEOUT = float(os.getenv("WEB_SEARCH_TIMEOUT", "8"))
+WEB_SEARCH_MAX_CONCURRENCY = int(os.getenv("WEB_SEARCH_MAX_CONCURRENCY", "8"))
+WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "3"))
+
+
+def normalize_search_query(query: str):
+    return " ".join(query.lower().split())
+
+
+class TavilyProvider:
+    """Upstream search through Tavily; one client for the whole process (reads TAVILY_API_KEY)."""
+
+    def __init__(self, max_results=WEB_SEARCH_MAX_RESULTS):
+        from langchain_community.tools import TavilySearchResults
+        self.tool = TavilySearchResults(max_results=max_results)
+
+    async def __call__(self, query: str):
+        results = await self.tool.ainvoke({"query": query})
+        if not isinstance(results, list):
+            # the tool reports upstream failures as a string instead of raising
+            raise RuntimeError(f"web search failed: {results}")
+        return results
+
+
+class WebSearchClient:
+    """
+    Shared web search used by the web_search tool.
+
+    Results are cached per normalized query for a TTL, identical queries that arrive while one is
+    already in flight wait for that call instead of making their own, every upstream call has a
+    hard timeout, and at most max_concurrency calls run at once. Failed calls are not cached.
+
+    `provider` is any async callable query -> list of {"url", "content"} dicts, so a local stand-in
+    can replace Tavily.
+    """
+
+    def __init__(self, provider=None, ttl=WEB_SEARCH_CACHE_TTL, timeout=WEB_SEARCH_TIMEOUT,
+                 max_concurrency=WEB_SEARCH_MAX_CONCURRENCY, max_entries=WEB_SEARCH_CACHE_MAX_ENTRIES):
+        self._provider = provider
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.cache = OrderedDict()  # normalized query -> (results, expires_at), in LRU order
+        self.in_flight = {}         # normalized query -> asyncio.Task of the upstream call
+        self.latencies = deque(maxlen=1000)
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+        self.timeouts = 0
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            self._provider = TavilyProvider()
+        return self._provider
+
+    async def _fetch(self, query, key):
+        async with self.semaphore:
+            self.upstream_calls += 1
+            started = time.perf_counter()
+            try:
+                with span("web_search"):
+                    results = await asyncio.wait_for(self.provider(query), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                self.upstream_errors += 1
+                errors.inc(stage="web_search")
+                raise TimeoutError(f"web search timed out after {self.timeout:.0f}s")
+            except Exception:
+                self.upstream_errors += 1
+                errors.inc(stage="web_search")
+                raise
+            finally:
+                self.latencies.append(time.perf_counter() - started)
+
+        if isinstance(results, list):
+            self.cache[key] = (results, time.monotonic() + self.ttl)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return results
+
+    async def search(self, query: str):
+        key = normalize_search_query(query)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self.cache.move_to_end(key)
+                self.hits += 1
+                cache_lookups.inc(cache="web_search", result="hit")
+                return entry[0]
+            del self.cache[key]
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            cache_lookups.inc(cache="web_search", result="coalesced")
+        else:
+            self.misses += 1
+            cache_lookups.inc(cache="web_search", result="miss")
+            task = asyncio.ensure_future(self._fetch(query, key))
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # shield: one caller being cancelled must not cancel the call the others are waiting on
+        return await asyncio.shield(task)
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.coalesced
+        latencies = sorted(self.latencies)
+        return {
+            "cached_queries": len(self.cache),
+            "in_flight": len(self.in_flight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "upstream_errors": self.upstream_errors,
+            "timeouts": self.timeouts,
+            "upstream_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+            "upstream_p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None,
+        }
+
+
+web_search_client = WebSearchClient()
+
+
+if __name__ == "__main__":
+    # Cache / coalescing / timeout behaviour against a local stand-in provider:  python web_search.py
+    async def stand_in(query):
+        await asyncio.sleep(2.0 if "slow" in query else 0.2)
+        return [{"url": f"https://example.com/{query.replace(' ', '-')}", "content": f"results for {query}"}]
+
+    async def main():
+        client = WebSearchClient(provider=stand_in, timeout=1.0, max_concurrency=4)
+        queries = ["weather in Pune", "Weather in  pune", "latest AI news"] * 10
+        started = time.perf_counter()
+        await asyncio.gather(*(client.search(q) for q in queries))
+        print(f"{len(queries)} concurrent searches in {time.perf_counter() - started:.2f}s")
+        await client.search("latest ai news")
+        try:
+            await client.search("slow query")
+        except TimeoutError as e:
+            print(f"timeout: {e}")
+        print(client.stats())
+
+    asyncio.run(main())
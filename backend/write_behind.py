@@ -0,0 +1,100 @@
+import asyncio
+import os
+import random
+import zlib
+from fastapi.concurrency import run_in_threadpool
+
+WRITE_BEHIND_WORKERS = int(os.getenv("WRITE_BEHIND_WORKERS", "4"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "1000"))
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "3"))
+
+
+class WriteBehindQueue:
+    """
+    Runs slow persistence work (SQLite history, Mem0 ingestion) after the response has been sent.
+
+    Every job has a key; jobs with the same key always land on the same worker, so writes to one
+    conversation are applied in order. The queues are bounded: when they are full, submit() waits,
+    which pushes back on the request instead of growing memory without limit.
+    """
+
+    def __init__(self, workers=WRITE_BEHIND_WORKERS, max_pending=WRITE_BEHIND_MAX_PENDING,
+                 max_retries=WRITE_BEHIND_MAX_RETRIES, base_delay=0.5):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.queues = []
+        self.tasks = []
+        self.completed = 0
+        self.failed = 0
+
+    @property
+    def running(self):
+        return bool(self.tasks)
+
+    def start(self):
+        if self.running:
+            return
+        per_worker = max(1, self.max_pending // self.workers)
+        self.queues = [asyncio.Queue(maxsize=per_worker) for _ in range(self.workers)]
+        self.tasks = [asyncio.create_task(self._worker(q)) for q in self.queues]
+        print(f"DEBUG: Write-behind queue started with {self.workers} workers")
+
+    async def submit(self, key: str, func, *args, **kwargs):
+        """Queues a blocking call (run in the threadpool) or a coroutine function, with retries."""
+        if not self.running:
+            self.start()
+        queue = self.queues[zlib.crc32(key.encode()) % len(self.queues)]
+        await queue.put((key, func, args, kwargs))
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(*job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, key, func, args, kwargs):
+        for attempt in range(self.max_retries + 1):
+            try:
+                if asyncio.iscoroutinefunction(func):
+                    await func(*args, **kwargs)
+                else:
+                    await run_in_threadpool(func, *args, **kwargs)
+                self.completed += 1
+                return
+            except Exception as e:
+                if attempt == self.max_retries:
+                    self.failed += 1
+                    print(f"DEBUG: Write-behind job '{key}' failed after {attempt + 1} attempts: {e}")
+                    return
+                delay = self.base_delay * (2 ** attempt) * random.uniform(0.5, 1.5)
+                print(f"DEBUG: Write-behind job '{key}' failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def stop(self, timeout=30.0):
+        """Drains everything already queued (up to timeout), then stops the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            pending = sum(q.qsize() for q in self.queues)
+            print(f"DEBUG: Write-behind drain timed out, {pending} jobs dropped")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        print(f"DEBUG: Write-behind queue stopped ({self.completed} done, {self.failed} failed)")
+
+    def stats(self):
+        return {
+            "pending": sum(q.qsize() for q in self.queues),
+            "completed": self.completed,
+            "failed": self.failed,
+        }
+
+
+persistence_queue = WriteBehindQueue()
@@ -234,7 +234,7 @@ async function sendMessage() {
     chatwindow.scrollTop = chatwindow.scrollHeight;
 
     try {
-        const response = await fetch('http://127.0.0.1:5000/chat', {
+        const response = await fetch('http://127.0.0.1:5000/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -245,29 +245,77 @@ async function sendMessage() {
                 conversation_id: currentConversationId
             })
         });
-        
-        const data = await response.json();
 
-        // Remove thinking bubble
-        document.getElementById('thinking-indicator')?.remove();
-
-        if (response.ok) {
-            if (data.response) {
-                addMessageToUI("Bot", data.response, "bot-message");
-                
-                if (data.conversation_id) {
-                    const wasNewConversation = !currentConversationId;
-                    currentConversationId = data.conversation_id;
-                    if (wasNewConversation) setTimeout(() => loadConversations(), 100);
-                }
-            }
-        } else {
+        if (!response.ok) {
+            document.getElementById('thinking-indicator')?.remove();
+            const data = await response.json();
             if (response.status === 401) {
                 addMessageToUI("System", "Session expired. Please login again.", "error-message");
                 setTimeout(() => document.getElementById('logout-button').click(), 2000);
             } else {
                 addMessageToUI("System", "Error: " + (data.detail || JSON.stringify(data)), "error-message");
             }
+            return;
+        }
+
+        // Read the Server-Sent Events stream and paint tokens as they arrive
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        let answerSpan = null;
+
+        const showStatus = (text) => {
+            const indicator = document.querySelector('#thinking-indicator span');
+            if (indicator) indicator.textContent = text;
+        };
+
+        const handleEvent = (event, data) => {
+            if (event === 'start') {
+                const wasNewConversation = !currentConversationId;
+                currentConversationId = data.conversation_id;
+                if (wasNewConversation) setTimeout(() => loadConversations(), 100);
+            } else if (event === 'tool_start') {
+                showStatus(`Using ${data.name}...`);
+            } else if (event === 'tool_end') {
+                showStatus("Thinking...");
+            } else if (event === 'token') {
+                if (!answerSpan) {
+                    document.getElementById('thinking-indicator')?.remove();
+                    addMessageToUI("Bot", "", "bot-message");
+                    answerSpan = document.getElementById('chatwindow').lastChild.lastChild;
+                }
+                answerSpan.textContent += data.content;
+                chatwindow.scrollTop = chatwindow.scrollHeight;
+            } else if (event === 'reset') {
+                if (answerSpan) answerSpan.textContent = "";
+            } else if (event === 'done') {
+                document.getElementById('thinking-indicator')?.remove();
+                if (!answerSpan) addMessageToUI("Bot", data.response, "bot-message");
+                else answerSpan.textContent = data.response;
+            } else if (event === 'error') {
+                document.getElementById('thinking-indicator')?.remove();
+                addMessageToUI("Bot", data.response, "bot-message");
+            }
+        };
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let event = "message";
+                let dataLine = "";
+                for (const line of frame.split("\n")) {
+                    if (line.startsWith("event: ")) event = line.slice(7);
+                    else if (line.startsWith("data: ")) dataLine += line.slice(6);
+                }
+                if (dataLine) handleEvent(event, JSON.parse(dataLine));
+            }
         }
     } catch (error) {
         document.getElementById('thinking-indicator')?.remove();
@@ -415,6 +463,9 @@ async function uploadFile() {
     const file = fileInput.files[0];
 
     if (!file) return;
+    if (fileInput.files.length > 1 || file.name.toLowerCase().endsWith('.zip')) {
+        return uploadFiles(fileInput, statusDiv);
+    }
 
     // 1. UI Feedback
     statusDiv.innerText = "⏳ Reading & Learning...";
@@ -434,13 +485,18 @@ async function uploadFile() {
             body: formData
         });
 
-        const data = await response.json();
-        
-        // 3. Handle Result
-        if (data.status === "success") {
+        let data = await response.json();
+
+        // 3. The server accepts the file right away and processes it in the background: poll the job
+        if (data.status === "accepted") {
+            fileInput.value = ""; // Reset input
+            data = await waitForUploadJob(data.job_id, label => { statusDiv.innerText = label; });
+        }
+
+        // 4. Handle Result
+        if (data.status === "done") {
             statusDiv.innerText = "✅ Knowledge Added!";
             statusDiv.style.color = "#4caf50"; // Green
-            fileInput.value = ""; // Reset input
             
             // Optional: clear message after 3 seconds
             setTimeout(() => { statusDiv.innerText = ""; }, 3000);
@@ -453,4 +509,84 @@ async function uploadFile() {
         statusDiv.style.color = "#f44336";
         console.error('Upload error:', error);
     }
-}
\ No newline at end of file
+}
+
+async function waitForUploadJob(jobId, onProgress) {
+    const stageLabels = {
+        queued: "⏳ Waiting in line...",
+        starting: "⏳ Reading & Learning...",
+        parsing: "⏳ Reading pages...",
+        splitting: "⏳ Splitting text...",
+        embedding: "⏳ Learning...",
+        indexing: "⏳ Indexing...",
+    };
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const response = await fetch(`http://127.0.0.1:5000/upload-doc/${jobId}`, {
+            headers: { 'Authorization': `Bearer ${authToken}` }
+        });
+        if (!response.ok) {
+            return { status: "error", message: "Upload status unavailable" };
+        }
+        const job = await response.json();
+        if (job.status === "done" || job.status === "failed") {
+            return job;
+        }
+        let label = stageLabels[job.stage] || "⏳ Reading & Learning...";
+        if (job.chunks) label += ` (${job.chunks} chunks)`;
+        else if (job.pages) label += ` (${job.pages} pages)`;
+        onProgress(label);
+    }
+}
+
+async function uploadFiles(fileInput, statusDiv) {
+    // Several files or a zip: one bulk request, then follow every job until all are finished
+    statusDiv.innerText = `⏳ Uploading ${fileInput.files.length} file(s)...`;
+    statusDiv.style.color = "#FFD700"; // Gold
+
+    const formData = new FormData();
+    for (const file of fileInput.files) {
+        formData.append('files', file);
+    }
+
+    try {
+        const response = await fetch('http://127.0.0.1:5000/upload-docs', {
+            method: 'POST',
+            headers: {
+                'Authorization': `Bearer ${authToken}`
+            },
+            body: formData
+        });
+        const data = await response.json();
+        if (data.status !== "accepted") {
+            statusDiv.innerText = "❌ Error: " + data.message;
+            statusDiv.style.color = "#f44336"; // Red
+            return;
+        }
+        fileInput.value = ""; // Reset input
+
+        const total = data.jobs.length;
+        let finished = 0;
+        const failed = [];
+        statusDiv.innerText = `⏳ Learning 0/${total} documents...`;
+        await Promise.all(data.jobs.map(async (job) => {
+            const result = await waitForUploadJob(job.job_id, () => {});
+            finished++;
+            if (result.status !== "done") failed.push(job.filename);
+            statusDiv.innerText = `⏳ Learning ${finished}/${total} documents...`;
+        }));
+
+        if (failed.length === 0) {
+            statusDiv.innerText = `✅ ${total} documents added!`;
+            statusDiv.style.color = "#4caf50"; // Green
+            setTimeout(() => { statusDiv.innerText = ""; }, 3000);
+        } else {
+            statusDiv.innerText = `❌ ${failed.length} of ${total} failed: ${failed.join(", ")}`;
+            statusDiv.style.color = "#f44336"; // Red
+        }
+    } catch (error) {
+        statusDiv.innerText = "❌ Server Error";
+        statusDiv.style.color = "#f44336";
+        console.error('Upload error:', error);
+    }
+}